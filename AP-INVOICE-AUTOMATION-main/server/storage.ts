@@ -129,14 +129,7 @@ export class MongoStorage implements IStorage {
           toUsd = totalAmount * 1.08; // Using approximate EUR to USD conversion
         }
         
-        await collection.updateOne(
-          { "invoice_header.invoice_num": invoice.invoice_header.invoice_num },
-          { $set: { 
-              "invoice_header.invoice_amount": totalAmount,
-              "invoice_header.to_usd": toUsd
-            } 
-          }
-        );
+        await this.saveRepairedAmounts(invoice, totalAmount, toUsd);
         
         // Update the invoice object to return the correct amounts
         invoice.invoice_header.invoice_amount = totalAmount;
@@ -170,14 +163,7 @@ export class MongoStorage implements IStorage {
           toUsd = totalAmount * 1.08; // Using approximate EUR to USD conversion
         }
         
-        await collection.updateOne(
-          { "invoice_header.invoice_num": invoiceNum },
-          { $set: { 
-              "invoice_header.invoice_amount": totalAmount,
-              "invoice_header.to_usd": toUsd
-            } 
-          }
-        );
+        await this.saveRepairedAmounts(invoice, totalAmount, toUsd);
         
         // Update the invoice object to return the correct amounts
         invoice.invoice_header.invoice_amount = totalAmount;
@@ -224,19 +210,208 @@ export class MongoStorage implements IStorage {
     updateData["invoice_header.invoice_amount"] = totalAmount;
     updateData["invoice_header.to_usd"] = toUsd;
     
-    const result = await collection.findOneAndUpdate(
-      { "invoice_header.invoice_num": invoiceNum },
+    // Take the header as it was at write time, so concurrent edits each apply their own delta
+    const previous = await collection.findOneAndUpdate(
+      { _id: currentInvoice._id },
       { $set: updateData },
-      { returnDocument: "after" }
+      { returnDocument: "before" }
     );
     
+    if (!previous) {
+      return null;
+    }
+    
+    const result = {
+      ...previous,
+      invoice_header: {
+        ...previous.invoice_header,
+        ...data,
+        invoice_amount: totalAmount,
+        to_usd: toUsd
+      }
+    };
+    await this.applyRollupDelta(previous.invoice_header, result.invoice_header);
+    
     return result;
   }
 
+  // Store recalculated amounts, unless another request already changed them
+  private async saveRepairedAmounts(invoice: Invoice, totalAmount: number, toUsd: number): Promise<void> {
+    const db = this.client.db(this.dbName);
+    const collection = db.collection<Invoice>("invoices");
+    
+    const previous = await collection.findOneAndUpdate(
+      {
+        _id: invoice._id,
+        "invoice_header.invoice_amount": invoice.invoice_header.invoice_amount ?? null,
+        "invoice_header.to_usd": invoice.invoice_header.to_usd ?? null
+      } as any,
+      { $set: { 
+          "invoice_header.invoice_amount": totalAmount,
+          "invoice_header.to_usd": toUsd
+        } 
+      },
+      { returnDocument: "before" }
+    );
+    
+    // Only the request whose write matched moves the rollups
+    if (previous) {
+      await this.applyRollupDelta(previous.invoice_header, {
+        ...previous.invoice_header,
+        invoice_amount: totalAmount,
+        to_usd: toUsd
+      });
+    }
+  }
+
+  // Rollup key of an invoice header for each dimension (mirrors analytics_rollups.py)
+  private rollupKeys(header: any): Record<string, string | null> {
+    const month = (header.invoice_date || "").slice(0, 7);
+    return {
+      total: "all",
+      vendor: header.vendor_name ?? null,
+      month: month || null,
+      currency: header.currency_code ?? null,
+      status: header.invoice_status ?? null,
+      type: header.invoice_type ?? null
+    };
+  }
+
+  // Recompute a vendor rollup's last_invoice_date and currencies from its invoices
+  // (increments only raise the date and add currencies; mirrors refresh_vendor_details)
+  private async refreshVendorDetails(vendor: string): Promise<void> {
+    const db = this.client.db(this.dbName);
+    const invoices = db.collection<Invoice>("invoices");
+    const query: any = { "invoice_header.vendor_name": vendor };
+    
+    const latest = await invoices.findOne(query, {
+      projection: { "invoice_header.invoice_date": 1 },
+      sort: { "invoice_header.invoice_date": -1 }
+    });
+    const lastInvoiceDate = latest?.invoice_header?.invoice_date;
+    const currencies = (await invoices.distinct("invoice_header.currency_code", query))
+      .filter(Boolean)
+      .sort();
+    
+    const set: any = {};
+    const unset: any = {};
+    if (lastInvoiceDate) set.last_invoice_date = lastInvoiceDate; else unset.last_invoice_date = "";
+    if (currencies.length > 0) set.currencies = currencies; else unset.currencies = "";
+    const update: any = {};
+    if (Object.keys(set).length > 0) update.$set = set;
+    if (Object.keys(unset).length > 0) update.$unset = unset;
+    await db.collection<any>("invoice_rollups").updateOne({ _id: `vendor|${vendor}` }, update);
+  }
+
+  // Keep the Python-maintained rollups in step with a header written by this server
+  // (mirrors record_header_change in analytics_rollups.py)
+  private async applyRollupDelta(previous: any, updated: any): Promise<void> {
+    const db = this.client.db(this.dbName);
+    const rollups = db.collection<any>("invoice_rollups");
+    
+    // Nothing to adjust until the pipeline has built the rollups
+    if (!(await rollups.findOne({ _id: "total|all" }, { projection: { _id: 1 } }))) {
+      return;
+    }
+    
+    const previousAmount = previous.to_usd || 0;
+    const updatedAmount = updated.to_usd || 0;
+    const previousKeys = this.rollupKeys(previous);
+    const updatedKeys = this.rollupKeys(updated);
+    const operations: any[] = [];
+    const emptied: string[] = [];
+    
+    const adjust = (dimension: string, key: string, count: number, amount: number, header?: any) => {
+      const update: any = {
+        $inc: { count, amount_usd: amount },
+        $setOnInsert: { dimension, key }
+      };
+      if (dimension === "vendor" && header) {
+        if (header.invoice_date) update.$max = { last_invoice_date: header.invoice_date };
+        if (header.currency_code) update.$addToSet = { currencies: header.currency_code };
+      }
+      operations.push({
+        updateOne: { filter: { _id: `${dimension}|${key}` }, update, upsert: true }
+      });
+    };
+    
+    for (const dimension of Object.keys(updatedKeys)) {
+      const oldKey = previousKeys[dimension];
+      const newKey = updatedKeys[dimension];
+      if (oldKey === newKey) {
+        if (newKey !== null && updatedAmount !== previousAmount) {
+          adjust(dimension, newKey, 0, updatedAmount - previousAmount);
+        }
+        continue;
+      }
+      if (oldKey !== null) {
+        adjust(dimension, oldKey, -1, -previousAmount);
+        emptied.push(`${dimension}|${oldKey}`);
+      }
+      if (newKey !== null) {
+        adjust(dimension, newKey, 1, updatedAmount, updated);
+      }
+    }
+    
+    if (operations.length > 0) {
+      await rollups.bulkWrite(operations, { ordered: false });
+    }
+    
+    // A rebuild has no documents for keys without invoices
+    if (emptied.length > 0) {
+      await rollups.deleteMany({ _id: { $in: emptied }, count: { $lte: 0 } });
+    }
+    
+    const vendor = previousKeys.vendor;
+    const vendorDetailsChanged = previous.invoice_date !== updated.invoice_date ||
+      previous.currency_code !== updated.currency_code;
+    if (vendor !== null && (vendor !== updatedKeys.vendor || vendorDetailsChanged)) {
+      await this.refreshVendorDetails(vendor);
+    }
+  }
+
+  // Read pre-aggregated rollups maintained by the Python pipeline
+  private async getRollupSummary(): Promise<InvoiceSummary | null> {
+    const db = this.client.db(this.dbName);
+    const rollups = db.collection<any>("invoice_rollups");
+    
+    const total = await rollups.findOne({ _id: "total|all" });
+    if (!total) {
+      return null;
+    }
+    
+    // Keys whose last invoice just moved away can briefly sit at count 0
+    const typesResult = await rollups.find({ dimension: "type", count: { $gt: 0 } }).sort({ count: -1 }).toArray();
+    const monthlyResult = await rollups.find({ dimension: "month", count: { $gt: 0 } }).sort({ key: 1 }).toArray();
+    
+    return {
+      total_invoices: total.count,
+      total_amount: total.amount_usd,
+      invoice_types: typesResult.map(item => ({
+        type: item.key,
+        count: item.count,
+        amount: item.amount_usd
+      })),
+      monthly_totals: monthlyResult.map(item => ({
+        month: item.key,
+        amount: item.amount_usd
+      }))
+    };
+  }
+
   async getAnalyticsSummary(filters: any = {}): Promise<InvoiceSummary> {
     const db = this.client.db(this.dbName);
     const collection = db.collection<Invoice>("invoices");
     
+    // Unfiltered summaries come straight from the rollups when available
+    const hasFilters = Boolean(filters.vendor || filters.currency || (filters.startDate && filters.endDate));
+    if (!hasFilters) {
+      const rollupSummary = await this.getRollupSummary();
+      if (rollupSummary) {
+        return rollupSummary;
+      }
+    }
+    
     const query: any = {};
     
     // Apply filters
@@ -351,6 +526,21 @@ export class MongoStorage implements IStorage {
     const db = this.client.db(this.dbName);
     const collection = db.collection("invoices");
 
+    // Prefer the per-vendor rollups maintained by the Python pipeline
+    const vendorRollups = await db.collection<any>("invoice_rollups")
+      .find({ dimension: "vendor", count: { $gt: 0 } })
+      .sort({ amount_usd: -1 })
+      .toArray();
+    if (vendorRollups.length > 0) {
+      return vendorRollups.map(item => ({
+        vendor_name: item.key,
+        total_invoices: item.count,
+        total_amount_usd: item.amount_usd,
+        last_invoice_date: item.last_invoice_date,
+        currencies: item.currencies || []
+      }));
+    }
+
     const pipeline = [
       {
         $group: {
@@ -0,0 +1,168 @@
+from pymongo import UpdateOne
+
+# Collection holding pre-aggregated dashboard totals
+ROLLUP_COLLECTION = "invoice_rollups"
+
+# Rollup dimension -> function extracting its key from an invoice header
+DIMENSIONS = {
+    "vendor": lambda hdr: hdr.get("vendor_name"),
+    "month": lambda hdr: (hdr.get("invoice_date") or "")[:7] or None,
+    "currency": lambda hdr: hdr.get("currency_code"),
+    "status": lambda hdr: hdr.get("invoice_status"),
+    "type": lambda hdr: hdr.get("invoice_type")
+}
+
+# Fields needed to compute rollups from an invoice document
+ROLLUP_PROJECTION = {
+    "invoice_header.vendor_name": 1,
+    "invoice_header.invoice_date": 1,
+    "invoice_header.currency_code": 1,
+    "invoice_header.invoice_status": 1,
+    "invoice_header.invoice_type": 1,
+    "invoice_header.to_usd": 1
+}
+
+def rollup_id(dimension, key):
+    """Build the _id of a rollup document."""
+    return f"{dimension}|{key}"
+
+def _amount(hdr):
+    return hdr.get("to_usd") or 0
+
+def _rollup_update(dimension, key, count, amount, hdr=None):
+    """Build an upsert that adjusts one rollup document by count/amount."""
+    update = {
+        "$inc": {"count": count, "amount_usd": amount},
+        "$setOnInsert": {"dimension": dimension, "key": key}
+    }
+    if dimension == "vendor" and hdr is not None:
+        if hdr.get("invoice_date"):
+            update["$max"] = {"last_invoice_date": hdr["invoice_date"]}
+        if hdr.get("currency_code"):
+            update["$addToSet"] = {"currencies": hdr["currency_code"]}
+    return UpdateOne({"_id": rollup_id(dimension, key)}, update, upsert=True)
+
+def record_invoice(db, invoice_doc):
+    """Add a newly inserted invoice to every rollup it belongs to."""
+    hdr = invoice_doc.get("invoice_header", {})
+    amount = _amount(hdr)
+    operations = [_rollup_update("total", "all", 1, amount)]
+    for dimension, key_func in DIMENSIONS.items():
+        key = key_func(hdr)
+        if key is not None:
+            operations.append(_rollup_update(dimension, key, 1, amount, hdr))
+    db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+def _rollup_keys(hdr):
+    """Rollup key of an invoice header for the total and every dimension."""
+    keys = {"total": "all"}
+    for dimension, key_func in DIMENSIONS.items():
+        keys[dimension] = key_func(hdr)
+    return keys
+
+def refresh_vendor_details(db, vendor):
+    """
+    Recompute a vendor rollup's last_invoice_date and currencies from its invoices.
+
+    Increments only ever raise the date and add currencies, so this is needed
+    whenever the vendor loses an invoice or one of its dates/currencies changes.
+    """
+    query = {"invoice_header.vendor_name": vendor}
+    latest = db.invoices.find_one(
+        query, {"invoice_header.invoice_date": 1}, sort=[("invoice_header.invoice_date", -1)]
+    )
+    last_invoice_date = (latest or {}).get("invoice_header", {}).get("invoice_date")
+    currencies = sorted(c for c in db.invoices.distinct("invoice_header.currency_code", query) if c)
+
+    details = {"last_invoice_date": last_invoice_date, "currencies": currencies}
+    update = {}
+    for field, value in details.items():
+        if value:
+            update.setdefault("$set", {})[field] = value
+        else:
+            update.setdefault("$unset", {})[field] = ""
+    db[ROLLUP_COLLECTION].update_one({"_id": rollup_id("vendor", vendor)}, update)
+
+def record_header_change(db, previous_hdr, updated_hdr):
+    """
+    Move an invoice between rollups after its header was updated.
+
+    server/storage.ts (applyRollupDelta) applies the same changes for edits
+    made from the dashboard.
+    """
+    previous_amount, updated_amount = _amount(previous_hdr), _amount(updated_hdr)
+    previous_keys, updated_keys = _rollup_keys(previous_hdr), _rollup_keys(updated_hdr)
+    operations = []
+    emptied = []
+    for dimension, key in updated_keys.items():
+        old_key = previous_keys[dimension]
+        if old_key == key:
+            if key is not None and updated_amount != previous_amount:
+                operations.append(_rollup_update(dimension, key, 0, updated_amount - previous_amount))
+            continue
+        if old_key is not None:
+            operations.append(_rollup_update(dimension, old_key, -1, -previous_amount))
+            emptied.append(rollup_id(dimension, old_key))
+        if key is not None:
+            operations.append(_rollup_update(dimension, key, 1, updated_amount, updated_hdr))
+    if operations:
+        db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+    # A rebuild has no documents for keys without invoices
+    if emptied:
+        db[ROLLUP_COLLECTION].delete_many({"_id": {"$in": emptied}, "count": {"$lte": 0}})
+
+    vendor = previous_keys["vendor"]
+    vendor_details_changed = any(
+        previous_hdr.get(field) != updated_hdr.get(field) for field in ("invoice_date", "currency_code")
+    )
+    if vendor is not None and (vendor != updated_keys["vendor"] or vendor_details_changed):
+        refresh_vendor_details(db, vendor)
+
+def record_status_change(db, invoice_doc, old_status, new_status):
+    """Move an invoice between status rollups after its status was updated."""
+    if old_status == new_status:
+        return
+    hdr = invoice_doc.get("invoice_header", {})
+    record_header_change(db, dict(hdr, invoice_status=old_status), dict(hdr, invoice_status=new_status))
+
+def rebuild_rollups(db, batch_size=1000):
+    """Recompute every rollup from the invoices collection and swap it in."""
+    rollups = {}
+
+    def add(dimension, key, hdr):
+        doc = rollups.setdefault(rollup_id(dimension, key), {
+            "_id": rollup_id(dimension, key),
+            "dimension": dimension,
+            "key": key,
+            "count": 0,
+            "amount_usd": 0
+        })
+        doc["count"] += 1
+        doc["amount_usd"] += _amount(hdr)
+        if dimension == "vendor":
+            if hdr.get("invoice_date"):
+                doc["last_invoice_date"] = max(doc.get("last_invoice_date", ""), hdr["invoice_date"])
+            if hdr.get("currency_code"):
+                currencies = doc.setdefault("currencies", [])
+                if hdr["currency_code"] not in currencies:
+                    currencies.append(hdr["currency_code"])
+
+    for invoice in db.invoices.find({}, ROLLUP_PROJECTION, batch_size=batch_size):
+        hdr = invoice.get("invoice_header", {})
+        add("total", "all", hdr)
+        for dimension, key_func in DIMENSIONS.items():
+            key = key_func(hdr)
+            if key is not None:
+                add(dimension, key, hdr)
+
+    staging = db[ROLLUP_COLLECTION + "_rebuild"]
+    staging.drop()
+    if rollups:
+        staging.insert_many(list(rollups.values()))
+        staging.rename(ROLLUP_COLLECTION, dropTarget=True)
+    else:
+        db[ROLLUP_COLLECTION].drop()
+
+    print(f"Rebuilt {len(rollups)} rollup documents.")
+    return len(rollups)
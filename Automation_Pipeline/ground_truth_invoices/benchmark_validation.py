@@ -0,0 +1,70 @@
+import bson
+from pymongo import monitoring
+
+from invoice_validator import InvoiceValidator
+from mongo_pool import create_mongo_client, DATABASE_NAME
+
+class ReplyBytesCounter(monitoring.CommandListener):
+    """Counts the BSON size of every server reply seen by a client"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.bytes_received = 0
+        self.commands = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.bytes_received += len(bson.encode(event.reply))
+        self.commands += 1
+
+    def failed(self, event):
+        pass
+
+def measure_batch(validator, counter, invoice_ids):
+    """Score a batch of invoices read-only and return (bytes, commands) transferred."""
+    counter.reset()
+    for invoice_id in invoice_ids:
+        invoice = validator.get_invoice(invoice_id)
+        if invoice:
+            validator.calculate_confidence_score(invoice)
+    return counter.bytes_received, counter.commands
+
+def run_benchmark(mongo_uri, batch_size=10):
+    """Compare bytes transferred per validation batch with and without projections."""
+    counter = ReplyBytesCounter()
+    client = create_mongo_client(mongo_uri, event_listeners=[counter])
+    try:
+        db = client[DATABASE_NAME]
+        invoice_ids = [doc["_id"] for doc in db.invoices.find({}, {"_id": 1}, limit=batch_size)]
+        if not invoice_ids:
+            print("No invoices found to benchmark.")
+            return {}
+
+        projected = InvoiceValidator(db=db)
+        full = InvoiceValidator(db=db)
+        full.invoice_projection = None
+        full.history_projection = None
+
+        full_bytes, full_commands = measure_batch(full, counter, invoice_ids)
+        projected_bytes, projected_commands = measure_batch(projected, counter, invoice_ids)
+
+        results = {
+            "batch_size": len(invoice_ids),
+            "full_bytes": full_bytes,
+            "full_commands": full_commands,
+            "projected_bytes": projected_bytes,
+            "projected_commands": projected_commands
+        }
+
+        print(f"Validation batch of {len(invoice_ids)} invoices:")
+        print(f"  Full documents: {full_bytes:,} bytes over {full_commands} commands")
+        print(f"  Projected:      {projected_bytes:,} bytes over {projected_commands} commands")
+        if projected_bytes:
+            print(f"  Reduction:      {full_bytes / projected_bytes:.1f}x")
+        return results
+    finally:
+        client.close()
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime
+
+# Gmail API resources (everything else on the service is a request method)
+GMAIL_RESOURCES = {"users", "messages", "attachments", "threads", "labels"}
+
+class CassetteMiss(BaseException):
+    """
+    Raised in replay mode when a request was never recorded.
+
+    Derives from BaseException so the pipeline's `except Exception` fallbacks
+    cannot hide it: a replay that diverges from its recording stops.
+    """
+
+class RecordedError(Exception):
+    """Replays an exception recorded from a live call whose type cannot be rebuilt"""
+
+    def __init__(self, error_type, message):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+
+def _describe_error(error):
+    """JSON-serialisable description of an exception raised by a live call."""
+    error_type = f"{type(error).__module__}.{type(error).__qualname__}"
+    description = {"type": error_type, "message": str(error)}
+    if error_type == "googleapiclient.errors.HttpError":
+        content = error.content
+        description.update({
+            "status": int(error.resp.status),
+            "content": content.decode("utf-8", "replace") if isinstance(content, bytes) else content,
+            "uri": error.uri
+        })
+    return description
+
+def _rebuild_error(description):
+    """Recreate a recorded exception, keeping HttpError so callers handle it the same way."""
+    if description["type"] == "googleapiclient.errors.HttpError":
+        import httplib2
+        from googleapiclient.errors import HttpError
+        return HttpError(
+            httplib2.Response({"status": description["status"]}),
+            description["content"].encode("utf-8"),
+            uri=description.get("uri")
+        )
+    return RecordedError(description["type"], description["message"])
+
+class Cassette:
+    """
+    Compressed, content-addressed store of external service responses.
+
+    Layout of the cassette directory:
+        index.jsonl         append-only lines of {"key": ..., "object": ...} or {"meta": {...}}
+        objects/ab/cdef...  zlib-compressed JSON ({"response": ...} or {"error": ...}),
+                            named by the SHA-256 of its content
+
+    In "record" mode responses from the live services are saved; in "replay"
+    mode they are served from disk and no network calls are made.
+    """
+
+    def __init__(self, path: str, mode: str = "replay"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.meta = {}
+        self.entries = {}
+        self.clock_ticks = 0
+        self.objects_dir = os.path.join(path, "objects")
+        self.index_path = os.path.join(path, "index.jsonl")
+
+        if mode == "record":
+            os.makedirs(self.objects_dir, exist_ok=True)
+        elif not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"No cassette found at {path}")
+        self._load_index()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as index:
+            for line in index:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "meta" in entry:
+                    self.meta.update(entry["meta"])
+                else:
+                    self.entries[entry["key"]] = entry["object"]
+
+    def _append_index(self, entry):
+        with open(self.index_path, "a", encoding="utf-8") as index:
+            index.write(json.dumps(entry, sort_keys=True) + "\n")
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def set_meta(self, **values):
+        """Record run metadata (e.g. start date, random seed)."""
+        self.meta.update(values)
+        self._append_index({"meta": values})
+
+    @staticmethod
+    def request_key(name, params) -> str:
+        """Stable key for a request: SHA-256 of its name and canonical parameters."""
+        payload = json.dumps([name, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def save(self, key, response):
+        """Store a JSON-serialisable response under a request key."""
+        content = json.dumps(response, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = object_path + ".tmp"
+            with open(tmp_path, "wb") as blob:
+                blob.write(zlib.compress(content, 9))
+            os.replace(tmp_path, object_path)
+        if self.entries.get(key) != digest:
+            self.entries[key] = digest
+            self._append_index({"key": key, "object": digest})
+
+    def load(self, key):
+        """Return the response recorded under a request key."""
+        digest = self.entries.get(key)
+        if digest is None:
+            raise CassetteMiss(key)
+        with open(self._object_path(digest), "rb") as blob:
+            return json.loads(zlib.decompress(blob.read()))
+
+    def call(self, name, params, func):
+        """
+        Record func()'s result, or replay it, for the request (name, params).
+
+        Exceptions are recorded too and raised again on replay.
+        """
+        key = self.request_key(name, params)
+        if self.replaying:
+            entry = self.load(key)
+            if "error" in entry:
+                raise _rebuild_error(entry["error"])
+            return entry["response"]
+        try:
+            response = func()
+        except Exception as e:
+            self.save(key, {"error": _describe_error(e)})
+            raise
+        self.save(key, {"response": response})
+        return response
+
+    def now(self) -> datetime:
+        """Wall-clock time, recorded in sequence so a replay sees the same values."""
+        self.clock_ticks += 1
+        return datetime.fromisoformat(
+            self.call("clock.now", [self.clock_ticks], lambda: datetime.now().isoformat())
+        )
+
+class _CassetteRequest:
+    """Stands in for a googleapiclient HttpRequest"""
+
+    def __init__(self, cassette, name, params, request=None):
+        self.cassette = cassette
+        self.name = name
+        self.params = params
+        self.request = request
+
+    def execute(self):
+        return self.cassette.call(self.name, self.params, self.request.execute if self.request else None)
+
+class CassetteService:
+    """
+    Wraps a Gmail API service object (or nothing, when replaying).
+
+    Resource calls such as users() and messages() return another wrapper;
+    request methods such as list() and get() return an object whose
+    execute() records or replays the response.
+    """
+
+    def __init__(self, cassette, service=None, path=()):
+        self._cassette = cassette
+        self._service = service
+        self._path = path
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            target = None
+            if self._service is not None:
+                target = getattr(self._service, name)(*args, **kwargs)
+            path = self._path + (name,)
+            if name in GMAIL_RESOURCES:
+                return CassetteService(self._cassette, target, path)
+            return _CassetteRequest(self._cassette, "gmail." + ".".join(path), [args, kwargs], target)
+        return call
+
+class _CassetteResponse:
+    def __init__(self, text):
+        self.text = text
+
+class CassetteModel:
+    """Wraps a Gemini GenerativeModel (or nothing, when replaying)"""
+
+    def __init__(self, cassette, model=None):
+        self._cassette = cassette
+        self._model = model
+
+    @staticmethod
+    def _content_params(contents):
+        """Make prompt parts hashable: inline data is replaced by its digest."""
+        params = []
+        for part in contents:
+            if isinstance(part, dict) and "data" in part:
+                data = part["data"]
+                if isinstance(data, str):
+                    data = data.encode("utf-8")
+                params.append({"mime_type": part.get("mime_type"), "sha256": hashlib.sha256(data).hexdigest()})
+            else:
+                params.append(part)
+        return params
+
+    def generate_content(self, contents):
+        response = self._cassette.call(
+            "gemini.generate_content",
+            self._content_params(contents),
+            lambda: {"text": self._model.generate_content(contents).text}
+        )
+        return _CassetteResponse(response["text"])
@@ -0,0 +1,202 @@
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+# Modules each subcommand needs; imported only when that subcommand runs
+COMMAND_MODULES = {
+    "ingest": ["watch_and_save"],
+    "validate": ["invoice_validator"],
+    "serve": ["validation_service"],
+    "benchmark": ["benchmark_validation"],
+    "rebuild": ["analytics_rollups", "duplicate_index", "invoice_export"],
+    "export": ["invoice_export"]
+}
+
+# Packages that only the ingest command may pull in
+HEAVY_PACKAGES = ["googleapiclient", "google_auth_oauthlib", "google.generativeai", "forex_python"]
+
+# Default startup budget (milliseconds of import time) for non-ingest commands
+STARTUP_BUDGET_MS = 500
+
+DEFAULT_MONGO_URI = os.environ.get("MONGO_URI", "ADD YOUR MONGO DB PUBLIC URL HERE")
+
+def load_command(name):
+    """Import the modules a subcommand needs and return them in order."""
+    return [importlib.import_module(module) for module in COMMAND_MODULES[name]]
+
+def measure_import_time(command):
+    """
+    Import a subcommand's modules in a fresh interpreter under -X importtime.
+
+    Returns (total self time in ms, set of imported module names).
+    """
+    code = f"import cli; cli.load_command({command!r})"
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing '{command}' failed:\n{completed.stderr}")
+
+    total_us = 0
+    modules = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Header line
+        total_us += int(fields[0])
+        modules.add(fields[2].strip())
+    return total_us / 1000, modules
+
+def check_startup(budget_ms=STARTUP_BUDGET_MS):
+    """Check that non-ingest commands skip the Gmail/Gemini stack and stay within budget."""
+    ok = True
+    for command in COMMAND_MODULES:
+        if command == "ingest":
+            continue
+        elapsed_ms, modules = measure_import_time(command)
+        heavy = sorted(
+            package for package in HEAVY_PACKAGES
+            if any(module == package or module.startswith(package + ".") for module in modules)
+        )
+        status = "OK"
+        if heavy:
+            status = f"FAIL (imports {', '.join(heavy)})"
+            ok = False
+        elif elapsed_ms > budget_ms:
+            status = f"FAIL (over {budget_ms} ms budget)"
+            ok = False
+        print(f"{command:<10} {elapsed_ms:8.1f} ms  {len(modules):4d} modules  {status}")
+    return ok
+
+def run_ingest(args):
+    (watch_and_save,) = load_command("ingest")
+    if args.record:
+        watch_and_save.main(args.record, "record", mongo_uri=args.mongo_uri)
+    elif args.replay:
+        watch_and_save.main(args.replay, "replay", mongo_uri=args.mongo_uri)
+    else:
+        watch_and_save.main(mongo_uri=args.mongo_uri)
+
+def run_validate(args):
+    (invoice_validator,) = load_command("validate")
+    validator = invoice_validator.InvoiceValidator(
+        mongo_uri=args.mongo_uri,
+        confidence_threshold=args.threshold
+    )
+    print("Scoring pending invoices (dry run)..." if args.dry_run else "Processing pending invoices...")
+    results = validator.process_pending_invoices(batch_size=args.batch_size, dry_run=args.dry_run)
+    invoice_validator.print_results(results)
+
+def run_serve(args):
+    (validation_service,) = load_command("serve")
+    from invoice_validator import InvoiceValidator
+    validator = InvoiceValidator(mongo_uri=args.mongo_uri, confidence_threshold=args.threshold)
+    service = validation_service.ValidationService(
+        validator,
+        batch_size=args.batch_size,
+        max_wait_ms=args.max_wait_ms
+    )
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        print("Validation service stopped.")
+
+def run_benchmark(args):
+    if args.target == "startup":
+        if not check_startup(args.budget_ms):
+            sys.exit(1)
+        return
+    (benchmark_validation,) = load_command("benchmark")
+    benchmark_validation.run_benchmark(args.mongo_uri, args.batch_size)
+
+def run_rebuild(args):
+    analytics_rollups, duplicate_index, invoice_export = load_command("rebuild")
+    from mongo_pool import get_database
+    db = get_database(args.mongo_uri)
+    if args.target in ("rollups", "all"):
+        analytics_rollups.rebuild_rollups(db)
+    if args.target in ("duplicates", "all"):
+        duplicate_index.build_duplicate_index(db)
+    if args.target in ("indexes", "all"):
+        invoice_export.ensure_export_indexes(db)
+
+def run_export(args):
+    (invoice_export,) = load_command("export")
+    from mongo_pool import get_database
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".") or "parquet"
+    since = datetime.fromisoformat(args.since) if args.since else None
+    invoice_export.export_invoices(
+        get_database(args.mongo_uri),
+        args.output,
+        fmt=fmt,
+        since=since,
+        incremental=args.incremental,
+        batch_size=args.batch_size
+    )
+
+def build_parser():
+    """Build the argument parser for all subcommands."""
+    parser = argparse.ArgumentParser(description="AP invoice automation pipeline")
+    parser.add_argument("--mongo-uri", default=DEFAULT_MONGO_URI,
+                        help="MongoDB connection string (defaults to $MONGO_URI)")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subcommands.add_parser("ingest", help="Fetch invoice emails, extract and store them, then validate")
+    cassette = ingest.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="DIR", help="Save Gmail, Gemini and currency responses to a cassette")
+    cassette.add_argument("--replay", metavar="DIR", help="Run offline from a recorded cassette")
+    ingest.set_defaults(func=run_ingest)
+
+    validate = subcommands.add_parser("validate", help="Score pending invoices")
+    validate.add_argument("--batch-size", type=int, default=10)
+    validate.add_argument("--threshold", type=float, default=0.75)
+    validate.add_argument("--dry-run", action="store_true", help="Score without updating invoices")
+    validate.set_defaults(func=run_validate)
+
+    serve = subcommands.add_parser("serve", help="Validate pending invoices as they are inserted (change stream)")
+    serve.add_argument("--batch-size", type=int, default=50)
+    serve.add_argument("--max-wait-ms", type=int, default=1000, help="Longest wait to fill a micro-batch")
+    serve.add_argument("--threshold", type=float, default=0.75)
+    serve.set_defaults(func=run_serve)
+
+    benchmark = subcommands.add_parser("benchmark", help="Run a benchmark")
+    benchmark.add_argument("target", choices=["validation", "startup"])
+    benchmark.add_argument("--batch-size", type=int, default=10)
+    benchmark.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS,
+                           help="Import time budget for the startup check")
+    benchmark.set_defaults(func=run_benchmark)
+
+    rebuild = subcommands.add_parser("rebuild", help="Recompute derived collections and indexes from invoices")
+    rebuild.add_argument("target", nargs="?", default="all", choices=["rollups", "duplicates", "indexes", "all"])
+    rebuild.set_defaults(func=run_rebuild)
+
+    export = subcommands.add_parser("export", help="Stream validated invoices to Parquet, Arrow or CSV")
+    export.add_argument("output", help="Output file (format taken from the extension unless --format is given)")
+    export.add_argument("--format", choices=["parquet", "arrow", "csv"])
+    export.add_argument("--since", help="Only invoices processed after this ISO timestamp")
+    export.add_argument("--incremental", metavar="NAME",
+                        help="Continue from the watermark stored under NAME and advance it")
+    export.add_argument("--batch-size", type=int, default=5000)
+    export.set_defaults(func=run_export)
+
+    return parser
+
+def main(argv=None):
+    """Parse arguments and run the chosen subcommand"""
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    finally:
+        from mongo_pool import close_mongo_clients
+        close_mongo_clients()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import difflib
+import hashlib
+import random
+import re
+from datetime import datetime, timedelta
+
+# Collection holding one fingerprint per ingested invoice
+FINGERPRINT_COLLECTION = "invoice_fingerprints"
+
+# MinHash / LSH parameters: NUM_BANDS * ROWS_PER_BAND permutations
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+
+# Candidates scoring at or above this are flagged as likely duplicates
+DUPLICATE_THRESHOLD = 0.8
+
+# Upper bound on candidates scored per invoice, so hot blocks stay cheap
+MAX_CANDIDATES = 50
+
+# Invoice dates further apart than this (after allowing for a day/month swap)
+# rule a pair out, unless the invoice numbers match
+DATE_WINDOW_DAYS = 3
+
+# Amounts differing by more than this fraction rule a pair out, unless the
+# invoice numbers match
+AMOUNT_TOLERANCE = 0.01
+
+# Invoice numbers less similar than this (after OCR normalization) belong to
+# different bills and rule a pair out
+NUMBER_MATCH_RATIO = 0.75
+
+# Numbers made up by create_invoice_document / extract_basic_invoice_details
+_GENERATED_INVOICE_NUM = re.compile(r"^INV\d{14}$")
+
+# Characters OCR commonly confuses, mapped to one representative
+_OCR_CONFUSABLE = str.maketrans({"o": "0", "i": "1", "l": "1", "s": "5", "b": "8", "z": "2"})
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240329)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_VENDOR_SUFFIXES = {"inc", "corp", "corporation", "co", "ltd", "llc", "limited", "pvt", "plc", "gmbh"}
+
+def normalize_vendor(vendor_name):
+    """Lowercase a vendor name and drop punctuation and legal suffixes."""
+    words = re.findall(r"[a-z0-9]+", str(vendor_name or "").lower())
+    return " ".join(word for word in words if word not in _VENDOR_SUFFIXES)
+
+def normalize_amount(amount):
+    """Round an amount to cents and return it as a string key (None if missing)."""
+    if amount is None:
+        return None
+    try:
+        return f"{round(float(amount), 2):.2f}"
+    except (TypeError, ValueError):
+        return None
+
+def normalize_invoice_num(invoice_num):
+    """Normalize an invoice number for misread comparison (None for generated numbers)."""
+    if not invoice_num or _GENERATED_INVOICE_NUM.match(str(invoice_num)):
+        return None
+    return "".join(re.findall(r"[a-z0-9]+", str(invoice_num).lower())).translate(_OCR_CONFUSABLE) or None
+
+def _parse_date(date_str):
+    try:
+        return datetime.strptime(str(date_str)[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+
+def _swap_day_month(date):
+    """The same date with day and month swapped, if that is a valid different date."""
+    if date.day > 12 or date.day == date.month:
+        return None
+    return date.replace(month=date.day, day=date.month)
+
+def date_gap_days(date_str1, date_str2):
+    """Days between two dates, allowing for a day/month swap (None if either is missing)."""
+    date1, date2 = _parse_date(date_str1), _parse_date(date_str2)
+    if not date1 or not date2:
+        return None
+    gaps = [abs((date1 - date2).days)]
+    swapped = _swap_day_month(date1)
+    if swapped:
+        gaps.append(abs((swapped - date2).days))
+    return min(gaps)
+
+def _window_days(date_str):
+    """Every day (YYYY-MM-DD) within DATE_WINDOW_DAYS of a date or its day/month swap."""
+    date = _parse_date(date_str)
+    if not date:
+        return [""]
+    centres = [date] + [d for d in [_swap_day_month(date)] if d]
+    return sorted({
+        (centre + timedelta(days=offset)).strftime("%Y-%m-%d")
+        for centre in centres
+        for offset in range(-DATE_WINDOW_DAYS, DATE_WINDOW_DAYS + 1)
+    })
+
+def _shingles(invoice_doc):
+    """Character 3-gram shingles over all line-item descriptions (tolerant of misreads)."""
+    shingles = set()
+    for line in invoice_doc.get("invoice_lines", []):
+        text = " ".join(re.findall(r"[a-z0-9]+", str(line.get("description") or "").lower()))
+        shingles.update(text[i:i + 3] for i in range(max(1, len(text) - 2)) if text)
+    return shingles
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+def minhash_signature(shingles):
+    """Compute a MinHash signature of NUM_PERM values for a set of shingles."""
+    if not shingles:
+        return [_MERSENNE_PRIME] * NUM_PERM
+    hashes = [_hash64(shingle) % _MERSENNE_PRIME for shingle in shingles]
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+def lsh_bands(signature):
+    """Hash each band of the signature into a blocking key."""
+    bands = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(",".join(map(str, rows)).encode("utf-8"), digest_size=8).hexdigest()
+        bands.append(f"lsh|{band}|{digest}")
+    return bands
+
+def _has_descriptions(signature):
+    return signature[0] != _MERSENNE_PRIME
+
+def _dated_blocks(fingerprint, day):
+    """Blocking keys of a fingerprint as if it were dated `day`."""
+    blocks = []
+    if fingerprint["amount"] is not None:
+        amount_key = f"{fingerprint['amount']:.2f}"
+        blocks.append(f"va|{fingerprint['vendor_key']}|{amount_key}|{day}")
+        blocks.append(f"ad|{amount_key}|{day}")
+    if _has_descriptions(fingerprint["signature"]):
+        blocks.extend(f"{band}|{day}" for band in lsh_bands(fingerprint["signature"]))
+    return blocks
+
+def query_blocks(fingerprint):
+    """
+    Blocking keys to look up candidates for a fingerprint.
+
+    Vendor/amount, amount and LSH keys are bucketed by day, so only invoices
+    inside the date window (or its day/month swap) are read however large a
+    vendor's history is; the invoice number key finds matches at any date.
+    """
+    blocks = []
+    for day in _window_days(fingerprint["invoice_date"]):
+        blocks.extend(_dated_blocks(fingerprint, day))
+    if fingerprint.get("num_key"):
+        blocks.append(f"num|{fingerprint['num_key']}")
+    return blocks
+
+def build_fingerprint(invoice_doc):
+    """Build the fingerprint document used to look up near-duplicates."""
+    hdr = invoice_doc.get("invoice_header", {})
+    amount_key = normalize_amount(hdr.get("invoice_amount"))
+
+    fingerprint = {
+        "invoice_num": hdr.get("invoice_num"),
+        "num_key": normalize_invoice_num(hdr.get("invoice_num")),
+        "vendor_key": normalize_vendor(hdr.get("vendor_name")),
+        "amount": float(amount_key) if amount_key is not None else None,
+        "invoice_date": str(hdr.get("invoice_date") or "")[:10],
+        "signature": minhash_signature(_shingles(invoice_doc))
+    }
+    fingerprint["blocks"] = _dated_blocks(fingerprint, fingerprint["invoice_date"])
+    if fingerprint["num_key"]:
+        fingerprint["blocks"].append(f"num|{fingerprint['num_key']}")
+    if invoice_doc.get("_id") is not None:
+        fingerprint["_id"] = invoice_doc["_id"]
+    return fingerprint
+
+def score_pair(fingerprint, candidate):
+    """
+    Score how likely two fingerprints describe the same bill (0-1).
+
+    Unless their invoice numbers match, invoices dated more than
+    DATE_WINDOW_DAYS apart or whose amounts differ by more than
+    AMOUNT_TOLERANCE score 0, so recurring bills are not flagged. Clearly
+    different invoice numbers also score 0, and numbers that differ at all
+    keep a pair below DUPLICATE_THRESHOLD.
+    """
+    num_key1, num_key2 = fingerprint.get("num_key"), candidate.get("num_key")
+    same_number = bool(num_key1) and num_key1 == num_key2
+    if num_key1 and num_key2 and not same_number:
+        if difflib.SequenceMatcher(None, num_key1, num_key2).ratio() < NUMBER_MATCH_RATIO:
+            return 0.0
+        number_similarity = 0.0
+    elif same_number:
+        number_similarity = 1.0
+    else:
+        number_similarity = 0.5  # Generated or missing number
+
+    gap = date_gap_days(fingerprint.get("invoice_date"), candidate.get("invoice_date"))
+    if gap is not None and gap > DATE_WINDOW_DAYS and not same_number:
+        return 0.0
+
+    amount1, amount2 = fingerprint.get("amount"), candidate.get("amount")
+    if amount1 and amount2:
+        amount_difference = abs(amount1 - amount2) / max(abs(amount1), abs(amount2))
+        if amount_difference > AMOUNT_TOLERANCE and not same_number:
+            return 0.0
+        amount_similarity = 1.0 - min(1.0, amount_difference)
+    else:
+        amount_similarity = 0.5
+
+    if not _has_descriptions(fingerprint["signature"]) or not _has_descriptions(candidate["signature"]):
+        description_similarity = 0.5  # No descriptions to compare
+    else:
+        description_similarity = sum(
+            1 for x, y in zip(fingerprint["signature"], candidate["signature"]) if x == y
+        ) / NUM_PERM
+
+    if fingerprint["vendor_key"] == candidate["vendor_key"]:
+        vendor_similarity = 1.0
+    else:
+        vendor_similarity = difflib.SequenceMatcher(
+            None, fingerprint["vendor_key"], candidate["vendor_key"]
+        ).ratio()
+
+    if gap is not None:
+        date_similarity = max(0.0, 1.0 - gap / 30)
+    else:
+        date_similarity = 0.5
+
+    return (description_similarity * 0.3) + (number_similarity * 0.25) + (amount_similarity * 0.2) + \
+        (vendor_similarity * 0.15) + (date_similarity * 0.1)
+
+def ensure_indexes(db):
+    """Create the multikey index over blocking keys."""
+    db[FINGERPRINT_COLLECTION].create_index("blocks")
+
+def find_near_duplicates(db, invoice_doc, threshold=DUPLICATE_THRESHOLD):
+    """Return likely duplicates of an invoice, best match first."""
+    fingerprint = build_fingerprint(invoice_doc)
+    blocks = query_blocks(fingerprint)
+    if not blocks:
+        return []
+
+    query = {"blocks": {"$in": blocks}}
+    if "_id" in fingerprint:
+        query["_id"] = {"$ne": fingerprint["_id"]}
+
+    # Candidates sharing the most blocks are scored first
+    candidates = db[FINGERPRINT_COLLECTION].aggregate([
+        {"$match": query},
+        {"$addFields": {"shared_blocks": {"$size": {"$setIntersection": ["$blocks", blocks]}}}},
+        {"$project": {"blocks": 0}},
+        {"$sort": {"shared_blocks": -1, "_id": 1}},
+        {"$limit": MAX_CANDIDATES}
+    ])
+    duplicates = []
+    for candidate in candidates:
+        score = score_pair(fingerprint, candidate)
+        if score >= threshold:
+            duplicates.append({
+                "invoice_id": candidate["_id"],
+                "invoice_num": candidate.get("invoice_num"),
+                "score": round(score, 4)
+            })
+
+    return sorted(duplicates, key=lambda d: d["score"], reverse=True)
+
+def add_to_index(db, invoice_doc):
+    """Store (or refresh) the fingerprint of an inserted invoice."""
+    fingerprint = build_fingerprint(invoice_doc)
+    db[FINGERPRINT_COLLECTION].replace_one({"_id": fingerprint["_id"]}, fingerprint, upsert=True)
+
+def build_duplicate_index(db, batch_size=1000):
+    """Fingerprint every historical invoice from scratch."""
+    collection = db[FINGERPRINT_COLLECTION]
+    collection.drop()
+    ensure_indexes(db)
+
+    projection = {
+        "invoice_header.invoice_num": 1,
+        "invoice_header.vendor_name": 1,
+        "invoice_header.invoice_amount": 1,
+        "invoice_header.invoice_date": 1,
+        "invoice_lines.description": 1
+    }
+    batch = []
+    count = 0
+    for invoice in db.invoices.find({}, projection, batch_size=batch_size):
+        batch.append(build_fingerprint(invoice))
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            count += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+
+    print(f"Indexed {count} invoices for duplicate detection.")
+    return count
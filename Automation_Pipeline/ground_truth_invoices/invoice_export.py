@@ -0,0 +1,212 @@
+import csv
+from datetime import datetime, timedelta
+
+# Collection storing the processed_at watermark of each incremental export
+EXPORT_STATE_COLLECTION = "export_state"
+
+# Incremental exports stop this far behind now: processed_at is set on the
+# validator's clock before its write commits, so recent values can still arrive
+EXPORT_SAFETY_LAG = timedelta(minutes=2)
+
+# Output columns (one row per invoice line, header fields repeated) and their types
+HEADER_COLUMNS = [
+    ("invoice_id", str),
+    ("invoice_num", str),
+    ("invoice_date", str),
+    ("vendor_name", str),
+    ("vendor_site_code", str),
+    ("organization_code", int),
+    ("invoice_amount", float),
+    ("currency_code", str),
+    ("to_usd", float),
+    ("payment_term", str),
+    ("invoice_type", str),
+    ("invoice_status", str),
+    ("confidence_score", float),
+    ("processed_at", datetime)
+]
+LINE_COLUMNS = [
+    ("line_number", int),
+    ("line_type", str),
+    ("description", str),
+    ("quantity", float),
+    ("unit_price", float),
+    ("line_amount", float)
+]
+COLUMNS = HEADER_COLUMNS + LINE_COLUMNS
+
+# Only the fields that end up in the export are read (never the base64 PDF)
+EXPORT_PROJECTION = {
+    "invoice_header.invoice_num": 1,
+    "invoice_header.invoice_date": 1,
+    "invoice_header.vendor_name": 1,
+    "invoice_header.vendor_site_code": 1,
+    "invoice_header.organization_code": 1,
+    "invoice_header.invoice_amount": 1,
+    "invoice_header.currency_code": 1,
+    "invoice_header.to_usd": 1,
+    "invoice_header.payment_term": 1,
+    "invoice_header.invoice_type": 1,
+    "invoice_header.invoice_status": 1,
+    "validation_details.confidence_score": 1,
+    "processed_at": 1,
+    "invoice_lines.line_number": 1,
+    "invoice_lines.line_type": 1,
+    "invoice_lines.description": 1,
+    "invoice_lines.quantity": 1,
+    "invoice_lines.unit_price": 1,
+    "invoice_lines.line_amount": 1
+}
+
+FORMATS = ["parquet", "arrow", "csv"]
+
+# Index serving the export's processed_at range scan and sort
+EXPORT_INDEX = [("processed_at", 1), ("_id", 1)]
+
+def _coerce(value, column_type):
+    """Convert a stored value to the column type (None if it cannot be)."""
+    if value is None:
+        return None
+    if column_type is datetime:
+        return value if isinstance(value, datetime) else None
+    try:
+        return column_type(value)
+    except (TypeError, ValueError):
+        return None
+
+def flatten_invoice(invoice):
+    """Yield one flat row per invoice line (one row with empty line fields if there are none)."""
+    hdr = invoice.get("invoice_header", {})
+    header_values = dict(hdr)
+    header_values["invoice_id"] = str(invoice["_id"])
+    header_values["confidence_score"] = invoice.get("validation_details", {}).get("confidence_score")
+    header_values["processed_at"] = invoice.get("processed_at")
+    header_row = {name: _coerce(header_values.get(name), column_type) for name, column_type in HEADER_COLUMNS}
+
+    lines = invoice.get("invoice_lines") or [{}]
+    for line in lines:
+        row = dict(header_row)
+        for name, column_type in LINE_COLUMNS:
+            row[name] = _coerce(line.get(name), column_type)
+        yield row
+
+class _CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=[name for name, _ in COLUMNS])
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class _ArrowWriter:
+    """Writes row chunks as Parquet row groups or Arrow IPC record batches"""
+
+    def __init__(self, path, fmt):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("Parquet/Arrow export requires pyarrow (pip install pyarrow)")
+        types = {str: pa.string(), int: pa.int64(), float: pa.float64(), datetime: pa.timestamp("ms")}
+        self.pa = pa
+        self.schema = pa.schema([(name, types[column_type]) for name, column_type in COLUMNS])
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, self.schema, compression="snappy")
+        else:
+            self.sink = pa.OSFile(path, "wb")
+            self.writer = pa.ipc.new_file(self.sink, self.schema)
+
+    def write(self, rows):
+        columns = {name: [row[name] for row in rows] for name, _ in COLUMNS}
+        self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+        if hasattr(self, "sink"):
+            self.sink.close()
+
+def _open_writer(path, fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return _CsvWriter(path) if fmt == "csv" else _ArrowWriter(path, fmt)
+
+def ensure_export_indexes(db):
+    """Create the index exports read through (run with the other index setup, not per export)."""
+    db.invoices.create_index(EXPORT_INDEX)
+
+def get_watermark(db, export_name):
+    """Return the processed_at cut-off of the last export under this name."""
+    state = db[EXPORT_STATE_COLLECTION].find_one({"_id": export_name})
+    return state.get("watermark") if state else None
+
+def export_invoices(db, output_path, fmt="parquet", since=None, incremental=None,
+                    batch_size=5000, chunk_rows=50000, safety_lag=EXPORT_SAFETY_LAG):
+    """
+    Stream validated invoices to a Parquet, Arrow or CSV file in bounded memory.
+
+    Args:
+        db: Database handle
+        output_path: File to write
+        fmt: "parquet", "arrow" or "csv"
+        since: Only export invoices processed after this datetime
+        incremental: Export name whose stored watermark is used as `since`
+            and advanced once the file has been written
+        batch_size: Documents fetched per cursor round trip
+        chunk_rows: Rows buffered before they are flushed to the file
+        safety_lag: Incremental exports only include invoices processed at
+            least this long ago; the cut-off becomes the new watermark
+
+    Returns:
+        Dict with the number of invoices and rows written and the new watermark
+    """
+    if incremental and since is None:
+        since = get_watermark(db, incremental)
+
+    processed_at = {"$gt": since} if since else {"$exists": True}
+    until = None
+    if incremental:
+        # Invoices still committing with an older processed_at are left for the next run
+        until = datetime.utcnow() - safety_lag
+        processed_at["$lte"] = until
+
+    query = {"processed_at": processed_at}
+    # Uses EXPORT_INDEX when present (ensure_export_indexes); otherwise the sort may spill to disk
+    cursor = db.invoices.find(query, EXPORT_PROJECTION, batch_size=batch_size, allow_disk_use=True) \
+        .sort(EXPORT_INDEX)
+
+    invoices = 0
+    rows_written = 0
+    watermark = until or since
+    buffer = []
+    writer = _open_writer(output_path, fmt)
+    try:
+        for invoice in cursor:
+            buffer.extend(flatten_invoice(invoice))
+            invoices += 1
+            if until is None:
+                watermark = invoice.get("processed_at") or watermark
+            if len(buffer) >= chunk_rows:
+                writer.write(buffer)
+                rows_written += len(buffer)
+                buffer = []
+        if buffer or rows_written == 0:
+            writer.write(buffer)
+            rows_written += len(buffer)
+    finally:
+        cursor.close()
+        writer.close()
+
+    # Only advance the watermark once the file is complete
+    if incremental and watermark is not None:
+        db[EXPORT_STATE_COLLECTION].update_one(
+            {"_id": incremental},
+            {"$set": {"watermark": watermark, "output_path": output_path, "exported_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    print(f"Exported {invoices} invoices ({rows_written} lines) to {output_path}")
+    return {"invoices": invoices, "rows": rows_written, "watermark": watermark}
@@ -2,41 +2,74 @@ import json
 import os
 import difflib
 from typing import Dict, Any, Optional, List, Tuple
-from pymongo import MongoClient
 from datetime import datetime
 import time
 
+from pymongo import ReturnDocument
+
+from analytics_rollups import record_status_change
+from mongo_pool import get_database
+
+# Fields read when scoring an invoice (never the base64 PDF)
+VALIDATION_PROJECTION = {
+    "invoice_header.invoice_num": 1,
+    "invoice_header.invoice_date": 1,
+    "invoice_header.vendor_name": 1,
+    "invoice_header.invoice_amount": 1,
+    "invoice_header.currency_code": 1,
+    "invoice_header.invoice_status": 1,
+    "invoice_header.to_usd": 1,
+    "invoice_lines": 1,
+    "duplicate_candidates": 1
+}
+
+# Fields read from historical invoices in compare_with_historical
+HISTORY_PROJECTION = {
+    "invoice_header.vendor_name": 1,
+    "invoice_header.invoice_amount": 1,
+    "invoice_header.invoice_date": 1,
+    "invoice_lines": 1
+}
+
 class InvoiceValidator:
     """Validate invoices and calculate confidence scores for automatic approval"""
     
-    def __init__(self, mongo_uri: str, confidence_threshold: float = 0.75):
+    # Projections used for every read; set to None to fetch full documents
+    invoice_projection = VALIDATION_PROJECTION
+    history_projection = HISTORY_PROJECTION
+    
+    def __init__(self, mongo_uri: str = None, confidence_threshold: float = 0.75, db=None):
         """
         Initialize the validator with MongoDB connection and confidence threshold
         
         Args:
-            mongo_uri: MongoDB connection string
+            mongo_uri: MongoDB connection string (used when no db is given)
             confidence_threshold: Minimum confidence score for auto-approval (0-1)
+            db: Database handle to reuse, e.g. from the shared connection pool
         """
         self.mongo_uri = mongo_uri
         self.confidence_threshold = confidence_threshold
-        self.db = self.connect_to_mongodb()
+        self.db = db if db is not None else self.connect_to_mongodb()
         
     def connect_to_mongodb(self):
-        """Connect to MongoDB and return database object"""
+        """Connect to MongoDB through the shared pool and return database object"""
         try:
-            client = MongoClient(self.mongo_uri)
-            return client["invoice_automation"]
+            return get_database(self.mongo_uri)
         except Exception as e:
             print(f"Failed to connect to MongoDB: {e}")
             raise
     
+    def get_invoice(self, invoice_id: Any) -> Optional[Dict]:
+        """Fetch the fields of an invoice needed for scoring"""
+        return self.db.invoices.find_one({"_id": invoice_id}, self.invoice_projection)
+    
     def get_historical_invoices(self, vendor_name: str = None) -> List[Dict]:
         """Retrieve historical invoices from MongoDB for comparison"""
         query = {"status": "Approved"}
         if vendor_name:
             query["invoice_header.vendor_name"] = vendor_name
             
-        return list(self.db.invoices.find(query, limit=100))
+        return list(self.db.invoices.find(query, self.history_projection, limit=100))
     
     def calculate_field_similarity(self, value1: Any, value2: Any) -> float:
         """
@@ -169,9 +202,9 @@ class InvoiceValidator:
         
         return (structure_score * 0.4) + (calculation_score * 0.3) + (historical_score * 0.3)
     
-    def process_new_invoice(self, invoice_id: str) -> Dict:
-        """Process a new invoice and potentially auto-approve it"""
-        invoice = self.db.invoices.find_one({"_id": invoice_id})
+    def process_new_invoice(self, invoice_id: str, dry_run: bool = False) -> Dict:
+        """Process a new invoice and potentially auto-approve it (dry_run scores without writing)"""
+        invoice = self.get_invoice(invoice_id)
         if not invoice:
             return {"error": "Invoice not found"}
             
@@ -184,41 +217,64 @@ class InvoiceValidator:
             "auto_approved": False
         }
         
-        if confidence >= self.confidence_threshold:
+        # Likely duplicates always go to a human, whatever their score
+        duplicates = invoice.get("duplicate_candidates") or []
+        if duplicates:
+            result["duplicate_of"] = [d.get("invoice_num") for d in duplicates]
+        
+        if dry_run:
+            result["auto_approved"] = confidence >= self.confidence_threshold and not duplicates
+            return result
+        
+        if confidence >= self.confidence_threshold and not duplicates:
             # Auto-approve the invoice
-            self.db.invoices.update_one(
+            previous = self.db.invoices.find_one_and_update(
                 {"_id": invoice_id},
                 {"$set": {
                     "invoice_header.invoice_status": "Approved",
                     "validation_details": result,
                     "processed_at": datetime.utcnow()
-                }}
+                }},
+                projection={"invoice_header.invoice_status": 1},
+                return_document=ReturnDocument.BEFORE
             )
             result["auto_approved"] = True
         else:
             # Mark for review
-            self.db.invoices.update_one(
+            previous = self.db.invoices.find_one_and_update(
                 {"_id": invoice_id},
                 {"$set": {
                     "invoice_header.invoice_status": "requires_review",
                     "validation_details": result,
                     "processed_at": datetime.utcnow()
-                }}
+                }},
+                projection={"invoice_header.invoice_status": 1},
+                return_document=ReturnDocument.BEFORE
+            )
+        
+        # Keep the dashboard status rollups in step with the update
+        if previous:
+            record_status_change(
+                self.db,
+                invoice,
+                previous.get("invoice_header", {}).get("invoice_status"),
+                "Approved" if result["auto_approved"] else "requires_review"
             )
         
         return result
     
-    def process_pending_invoices(self, batch_size: int = 10):
+    def process_pending_invoices(self, batch_size: int = 10, dry_run: bool = False):
         """Process all pending invoices in the system"""
         pending_invoices = self.db.invoices.find(
             {"invoice_header.invoice_status": "pending"},
+            {"_id": 1},
             limit=batch_size
         )
         
         results = []
         for invoice in pending_invoices:
             try:
-                result = self.process_new_invoice(invoice["_id"])
+                result = self.process_new_invoice(invoice["_id"], dry_run=dry_run)
                 results.append(result)
                 time.sleep(0.1)  # Small delay to avoid overwhelming the system
             except Exception as e:
@@ -239,7 +295,10 @@ def main():
     
     print("Processing pending invoices...")
     results = validator.process_pending_invoices()
-    
+    print_results(results)
+
+def print_results(results: List[Dict]):
+    """Print validation results in a readable form"""
     print("\nProcessing Results:")
     print("-" * 40)
     for result in results:
@@ -0,0 +1,48 @@
+import os
+import threading
+from pymongo import MongoClient
+
+# Database used by both the ingestion pipeline and the validator
+DATABASE_NAME = "invoice_automation"
+
+# Connection pool settings (override through environment variables)
+POOL_SETTINGS = {
+    "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", 20)),
+    "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+    "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 10000)),
+    "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+    "socketTimeoutMS": int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+}
+
+# Read preference is opt-in; the driver default (primary) applies otherwise
+if os.environ.get("MONGO_READ_PREFERENCE"):
+    POOL_SETTINGS["readPreference"] = os.environ["MONGO_READ_PREFERENCE"]
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def create_mongo_client(mongo_uri, **overrides):
+    """Create a new, unshared MongoClient using the pool settings plus any overrides."""
+    settings = dict(POOL_SETTINGS)
+    settings.update(overrides)
+    return MongoClient(mongo_uri, **settings)
+
+def get_mongo_client(mongo_uri):
+    """Return the process-wide MongoClient for this URI, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(mongo_uri)
+        if client is None:
+            client = create_mongo_client(mongo_uri)
+            _clients[mongo_uri] = client
+        return client
+
+def get_database(mongo_uri, name=DATABASE_NAME):
+    """Return a database handle backed by the shared connection pool."""
+    return get_mongo_client(mongo_uri)[name]
+
+def close_mongo_clients():
+    """Close every shared client (call once at process exit)."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,185 @@
+import copy
+
+from analytics_rollups import (
+    ROLLUP_COLLECTION,
+    rebuild_rollups,
+    record_header_change,
+    record_invoice,
+    record_status_change,
+)
+
+def _get(doc, path):
+    for part in path.split("."):
+        doc = (doc or {}).get(part)
+    return doc
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        value = _get(doc, field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$lte" in condition and not value <= condition["$lte"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+class FakeCollection:
+    """Just enough of a pymongo collection for the rollup code paths"""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.docs = []
+
+    def find(self, query=None, projection=None, batch_size=None):
+        return [doc for doc in self.docs if _matches(doc, query or {})]
+
+    def find_one(self, query, projection=None, sort=None):
+        docs = self.find(query)
+        for field, direction in reversed(sort or []):
+            docs.sort(key=lambda doc: _get(doc, field) or "", reverse=direction < 0)
+        return docs[0] if docs else None
+
+    def distinct(self, field, query):
+        return list({_get(doc, field) for doc in self.find(query)})
+
+    def insert_many(self, docs):
+        self.docs.extend(copy.deepcopy(docs))
+
+    def update_one(self, query, update, upsert=False):
+        doc = next(iter(self.find(query)), None)
+        if doc is None:
+            if not upsert:
+                return
+            doc = dict(query, **update.get("$setOnInsert", {}))
+            self.docs.append(doc)
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+        for field, value in update.get("$max", {}).items():
+            if field not in doc or value > doc[field]:
+                doc[field] = value
+        for field, value in update.get("$addToSet", {}).items():
+            values = doc.setdefault(field, [])
+            if value not in values:
+                values.append(value)
+        doc.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+
+    def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            self.update_one(operation._filter, operation._doc, upsert=operation._upsert)
+
+    def delete_many(self, query):
+        self.docs = [doc for doc in self.docs if not _matches(doc, query)]
+
+    def drop(self):
+        self.docs = []
+
+    def rename(self, name, dropTarget=False):
+        del self.db.collections[self.name]
+        self.name = name
+        self.db.collections[name] = self
+
+class FakeDb:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self, name)
+        return self.collections[name]
+
+    @property
+    def invoices(self):
+        return self["invoices"]
+
+def make_invoice(invoice_num, vendor, date, currency, to_usd, status="pending", invoice_type="Standard"):
+    return {
+        "_id": invoice_num,
+        "invoice_header": {
+            "invoice_num": invoice_num,
+            "vendor_name": vendor,
+            "invoice_date": date,
+            "currency_code": currency,
+            "to_usd": to_usd,
+            "invoice_status": status,
+            "invoice_type": invoice_type
+        }
+    }
+
+def snapshot(db):
+    docs = {}
+    for doc in db[ROLLUP_COLLECTION].find():
+        doc = dict(doc, amount_usd=round(doc["amount_usd"], 6))
+        if "currencies" in doc:
+            doc["currencies"] = sorted(doc["currencies"])
+        docs[doc["_id"]] = doc
+    return docs
+
+def ingest(db, invoices):
+    for invoice in invoices:
+        db.invoices.docs.append(invoice)
+        record_invoice(db, invoice)
+
+def edit_header(db, invoice, **changes):
+    previous = dict(invoice["invoice_header"])
+    invoice["invoice_header"].update(changes)
+    record_header_change(db, previous, invoice["invoice_header"])
+
+def assert_matches_rebuild(db):
+    incremental = snapshot(db)
+    rebuild_rollups(db)
+    assert incremental == snapshot(db)
+
+def sample_invoices():
+    return [
+        make_invoice("A-1", "Acme", "2024-03-01", "USD", 100.0),
+        make_invoice("A-2", "Acme", "2024-03-20", "EUR", 216.0),
+        make_invoice("G-1", "Globex", "2024-04-02", "USD", 50.5, invoice_type="Credit Memo"),
+        make_invoice("S-1", "Solo", "2024-05-09", "INR", 12.25)
+    ]
+
+def test_inserts_match_rebuild():
+    db = FakeDb()
+    ingest(db, sample_invoices())
+    assert_matches_rebuild(db)
+
+def test_status_changes_match_rebuild():
+    db = FakeDb()
+    invoices = sample_invoices()
+    ingest(db, invoices)
+    for invoice, status in zip(invoices, ["approved", "requires_review", "approved"]):
+        invoice["invoice_header"]["invoice_status"] = status
+        record_status_change(db, invoice, "pending", status)
+    assert "status|pending" in snapshot(db)
+    assert_matches_rebuild(db)
+
+def test_header_edits_match_rebuild():
+    db = FakeDb()
+    invoices = sample_invoices()
+    ingest(db, invoices)
+    # Amount only
+    edit_header(db, invoices[0], to_usd=120.0)
+    # Acme loses its latest invoice and its only EUR invoice to Globex
+    edit_header(db, invoices[1], vendor_name="Globex", invoice_date="2024-04-30", to_usd=200.0)
+    # Solo loses its only invoice, so its vendor, month and currency rollups disappear
+    edit_header(db, invoices[3], vendor_name="Acme", invoice_date="2024-03-05", currency_code="USD", to_usd=15.0)
+    # Date moves earlier within the same month and vendor
+    edit_header(db, invoices[2], invoice_date="2024-04-01", invoice_type="Standard")
+
+    rollups = snapshot(db)
+    assert "vendor|Solo" not in rollups and "month|2024-05" not in rollups
+    assert rollups["vendor|Acme"]["last_invoice_date"] == "2024-03-05"
+    assert rollups["vendor|Acme"]["currencies"] == ["USD"]
+    assert_matches_rebuild(db)
+
+def test_unchanged_header_writes_nothing():
+    db = FakeDb()
+    invoices = sample_invoices()
+    ingest(db, invoices)
+    before = snapshot(db)
+    edit_header(db, invoices[0])
+    assert snapshot(db) == before
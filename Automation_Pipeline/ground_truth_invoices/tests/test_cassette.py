@@ -0,0 +1,86 @@
+import pytest
+
+from cassette import Cassette, CassetteMiss, CassetteModel, CassetteService, RecordedError
+
+class FakeRequest:
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        return self.response
+
+class FakeGmail:
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def attachments(self):
+        return self
+
+    def list(self, **kwargs):
+        return FakeRequest({"messages": [{"id": "m1"}]})
+
+    def get(self, **kwargs):
+        if kwargs.get("id") == "broken":
+            return FakeRequest(error=ValueError("attachment unavailable"))
+        return FakeRequest({"id": kwargs.get("id"), "data": "x" * 1000})
+
+class FakeModel:
+    def generate_content(self, contents):
+        class Response:
+            text = '{"invoice_num": "A-1"}'
+        return Response()
+
+PDF_PROMPT = ["Extract the invoice", {"mime_type": "application/pdf", "data": b"%PDF-1.4"}]
+
+def record(path):
+    cassette = Cassette(path, "record")
+    service = CassetteService(cassette, FakeGmail())
+    model = CassetteModel(cassette, FakeModel())
+    cassette.set_meta(seed=7)
+    listing = service.users().messages().list(userId="me", q="subject:invoice").execute()
+    attachment = service.users().messages().attachments().get(userId="me", messageId="m1", id="a1").execute()
+    with pytest.raises(ValueError):
+        service.users().messages().attachments().get(userId="me", messageId="m1", id="broken").execute()
+    text = model.generate_content(PDF_PROMPT).text
+    clock = [cassette.now(), cassette.now()]
+    return listing, attachment, text, clock
+
+def test_round_trip_replays_responses_without_services(tmp_path):
+    listing, attachment, text, clock = record(str(tmp_path))
+
+    cassette = Cassette(str(tmp_path), "replay")
+    service = CassetteService(cassette)
+    model = CassetteModel(cassette)
+    assert cassette.meta["seed"] == 7
+    assert service.users().messages().list(userId="me", q="subject:invoice").execute() == listing
+    assert service.users().messages().attachments().get(userId="me", messageId="m1", id="a1").execute() == attachment
+    assert model.generate_content(PDF_PROMPT).text == text
+    assert [cassette.now(), cassette.now()] == clock
+
+def test_recorded_errors_are_raised_on_replay(tmp_path):
+    record(str(tmp_path))
+    service = CassetteService(Cassette(str(tmp_path), "replay"))
+    with pytest.raises(RecordedError, match="attachment unavailable"):
+        service.users().messages().attachments().get(userId="me", messageId="m1", id="broken").execute()
+
+def test_unrecorded_request_is_not_swallowed_by_except_exception(tmp_path):
+    record(str(tmp_path))
+    service = CassetteService(Cassette(str(tmp_path), "replay"))
+    with pytest.raises(CassetteMiss):
+        try:
+            service.users().messages().get(userId="me", id="never-recorded").execute()
+        except Exception:
+            pytest.fail("CassetteMiss was caught by except Exception")
+
+def test_identical_responses_are_stored_once(tmp_path):
+    cassette = Cassette(str(tmp_path), "record")
+    cassette.call("a", [1], lambda: {"same": True})
+    cassette.call("b", [2], lambda: {"same": True})
+    objects = list((tmp_path / "objects").rglob("*"))
+    assert len([path for path in objects if path.is_file()]) == 1
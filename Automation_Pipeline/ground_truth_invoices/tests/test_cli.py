@@ -0,0 +1,31 @@
+import types
+
+import pytest
+
+import cli
+from cli import COMMAND_MODULES, HEAVY_PACKAGES, measure_import_time
+
+@pytest.mark.parametrize("command", [name for name in COMMAND_MODULES if name != "ingest"])
+def test_command_does_not_import_ingest_dependencies(command):
+    _, modules = measure_import_time(command)
+    heavy = [
+        package for package in HEAVY_PACKAGES
+        if any(module == package or module.startswith(package + ".") for module in modules)
+    ]
+    assert not heavy, f"'{command}' imports {heavy}"
+    assert "watch_and_save" not in modules
+
+@pytest.mark.parametrize("argv, cassette", [
+    ([], (None, None)),
+    (["--record", "rec"], ("rec", "record")),
+    (["--replay", "rec"], ("rec", "replay"))
+])
+def test_ingest_uses_the_mongo_uri_option(monkeypatch, argv, cassette):
+    calls = []
+    def fake_main(cassette_path=None, cassette_mode=None, mongo_uri=None):
+        calls.append((cassette_path, cassette_mode, mongo_uri))
+    monkeypatch.setattr(cli, "load_command", lambda name: [types.SimpleNamespace(main=fake_main)])
+
+    args = cli.build_parser().parse_args(["--mongo-uri", "mongodb://other:27017", "ingest"] + argv)
+    args.func(args)
+    assert calls == [cassette + ("mongodb://other:27017",)]
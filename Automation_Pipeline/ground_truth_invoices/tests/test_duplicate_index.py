@@ -0,0 +1,110 @@
+from duplicate_index import (
+    DUPLICATE_THRESHOLD,
+    NUM_BANDS,
+    build_fingerprint,
+    lsh_bands,
+    minhash_signature,
+    query_blocks,
+    score_pair,
+)
+
+def make_invoice(invoice_num="A-1001", vendor="ABC Corp", amount=1200.0, date="2024-03-01",
+                 descriptions=("Annual software license renewal",)):
+    return {
+        "invoice_header": {
+            "invoice_num": invoice_num,
+            "vendor_name": vendor,
+            "invoice_amount": amount,
+            "invoice_date": date
+        },
+        "invoice_lines": [{"description": description} for description in descriptions]
+    }
+
+def score(invoice1, invoice2):
+    return score_pair(build_fingerprint(invoice1), build_fingerprint(invoice2))
+
+def test_lsh_bands_are_deterministic_and_one_per_band():
+    signature = minhash_signature({"abc", "bcd", "cde"})
+    bands = lsh_bands(signature)
+    assert len(bands) == NUM_BANDS
+    assert bands == lsh_bands(list(signature))
+    assert all(band.startswith(f"lsh|{i}|") for i, band in enumerate(bands))
+
+def test_lsh_bands_differ_for_unrelated_signatures():
+    bands1 = lsh_bands(minhash_signature({"con", "ons", "nsu"}))
+    bands2 = lsh_bands(minhash_signature({"har", "ard", "rdw"}))
+    assert not set(bands1) & set(bands2)
+
+def test_build_fingerprint_normalizes_fields():
+    fingerprint = build_fingerprint(make_invoice(invoice_num="INV-0O1", vendor="ABC Corp.", amount="1200"))
+    assert fingerprint["vendor_key"] == "abc"
+    assert fingerprint["amount"] == 1200.0
+    assert fingerprint["num_key"] == "1nv001"
+    assert "va|abc|1200.00|2024-03-01" in fingerprint["blocks"]
+    assert "num|1nv001" in fingerprint["blocks"]
+    assert any(block.startswith("lsh|") for block in fingerprint["blocks"])
+
+def test_build_fingerprint_skips_generated_numbers_and_empty_descriptions():
+    fingerprint = build_fingerprint(make_invoice(invoice_num="INV20240301120000", descriptions=()))
+    assert fingerprint["num_key"] is None
+    assert not any(block.startswith(("num|", "lsh|")) for block in fingerprint["blocks"])
+
+def test_build_fingerprint_keeps_id():
+    invoice = make_invoice()
+    invoice["_id"] = "abc123"
+    assert build_fingerprint(invoice)["_id"] == "abc123"
+
+def test_misread_duplicate_is_flagged():
+    original = make_invoice()
+    misread = make_invoice(invoice_num="A-10O1", vendor="abc corp", date="2024-03-02",
+                           descriptions=("Annual software licence renewal",))
+    assert score(original, misread) >= DUPLICATE_THRESHOLD
+
+def test_recurring_monthly_invoices_are_not_flagged():
+    current = make_invoice(invoice_num="A-1006", date="2024-06-01")
+    for month in ("05", "04", "01"):
+        earlier = make_invoice(invoice_num=f"A-10{month}", date=f"2024-{month}-01")
+        assert score(current, earlier) < DUPLICATE_THRESHOLD
+
+def test_undescribed_invoices_two_weeks_apart_are_not_flagged():
+    invoice1 = make_invoice(invoice_num="INV20240301120000", date="2024-03-01", descriptions=())
+    invoice2 = make_invoice(invoice_num="INV20240316120000", date="2024-03-16", descriptions=())
+    assert score(invoice1, invoice2) < DUPLICATE_THRESHOLD
+
+def test_same_number_with_swapped_day_and_month_is_flagged():
+    invoice1 = make_invoice(date="2024-03-04")
+    invoice2 = make_invoice(date="2024-04-03")
+    assert score(invoice1, invoice2) >= DUPLICATE_THRESHOLD
+
+def test_same_number_far_apart_is_still_scored():
+    invoice1 = make_invoice(date="2024-01-10")
+    invoice2 = make_invoice(date="2024-06-20")
+    assert score(invoice1, invoice2) > 0
+
+def test_query_blocks_reach_candidates_inside_the_window_only():
+    fingerprint = build_fingerprint(make_invoice(invoice_num="A-1", date="2024-03-10"))
+    blocks = set(query_blocks(fingerprint))
+    nearby = build_fingerprint(make_invoice(invoice_num="A-2", date="2024-03-12"))
+    far = build_fingerprint(make_invoice(invoice_num="A-3", date="2024-04-20"))
+    assert blocks & set(nearby["blocks"])
+    assert not blocks & set(far["blocks"])
+
+def test_same_vendor_with_different_number_and_amount_is_not_flagged():
+    invoice1 = make_invoice(invoice_num="A-1001", amount=1000.0, date="2024-03-01", descriptions=("Hardware Purchase",))
+    invoice2 = make_invoice(invoice_num="B-7788", amount=450.0, date="2024-03-03", descriptions=("Hardware Purchase",))
+    assert score(invoice1, invoice2) < DUPLICATE_THRESHOLD
+
+def test_same_vendor_and_amount_with_unrelated_numbers_is_not_flagged():
+    invoice1 = make_invoice(invoice_num="A-1001", descriptions=())
+    invoice2 = make_invoice(invoice_num="Z-5521", descriptions=())
+    assert score(invoice1, invoice2) < DUPLICATE_THRESHOLD
+
+def test_next_invoice_in_a_sequence_is_not_flagged():
+    invoice1 = make_invoice(invoice_num="A-1001", date="2024-03-01")
+    invoice2 = make_invoice(invoice_num="A-1002", date="2024-03-02")
+    assert score(invoice1, invoice2) < DUPLICATE_THRESHOLD
+
+def test_different_amounts_within_window_are_not_flagged_without_a_number_match():
+    invoice1 = make_invoice(invoice_num="INV20240301120000")
+    invoice2 = make_invoice(invoice_num="INV20240301130000", amount=1300.0)
+    assert score(invoice1, invoice2) == 0.0
@@ -0,0 +1,158 @@
+import csv
+from datetime import datetime, timedelta
+
+import pytest
+
+from invoice_export import (
+    COLUMNS,
+    EXPORT_INDEX,
+    EXPORT_STATE_COLLECTION,
+    ensure_export_indexes,
+    export_invoices,
+    flatten_invoice,
+)
+
+INVOICE = {
+    "_id": "665f1c2e9b1e8a0012345678",
+    "invoice_header": {
+        "invoice_num": "INV-100",
+        "invoice_date": "2024-03-01",
+        "vendor_name": "Acme Supplies",
+        "organization_code": "204",
+        "invoice_amount": "1250.50",
+        "currency_code": "USD",
+        "to_usd": 1250.5,
+        "invoice_status": "approved"
+    },
+    "validation_details": {"confidence_score": 0.92},
+    "processed_at": datetime(2024, 3, 2, 9, 30),
+    "invoice_lines": [
+        {"line_number": 1, "description": "Paper", "quantity": "10", "unit_price": 25, "line_amount": 250},
+        {"line_number": 2, "description": "Toner", "quantity": 4, "unit_price": "n/a", "line_amount": 1000.5}
+    ]
+}
+
+class FakeCursor(list):
+    def sort(self, keys):
+        return self
+
+    def close(self):
+        pass
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.queries = []
+        self.updates = []
+        self.indexes = []
+
+    def create_index(self, keys):
+        self.indexes.append(keys)
+
+    def find(self, query, projection=None, batch_size=None, allow_disk_use=False):
+        self.queries.append(query)
+        return FakeCursor(self.docs)
+
+    def find_one(self, query):
+        return None
+
+    def update_one(self, query, update, upsert=False):
+        self.updates.append(update["$set"])
+
+class FakeDb(dict):
+    def __init__(self, docs):
+        super().__init__({"invoices": FakeCollection(docs), EXPORT_STATE_COLLECTION: FakeCollection()})
+
+    def __getattr__(self, name):
+        return self[name]
+
+def test_flatten_invoice_repeats_header_per_line_and_coerces_types():
+    rows = list(flatten_invoice(INVOICE))
+    assert len(rows) == 2
+    assert [row["line_number"] for row in rows] == [1, 2]
+    assert all(row["invoice_num"] == "INV-100" for row in rows)
+    assert rows[0]["organization_code"] == 204
+    assert rows[0]["invoice_amount"] == 1250.5
+    assert rows[0]["quantity"] == 10.0
+    assert rows[0]["confidence_score"] == 0.92
+    assert rows[1]["unit_price"] is None
+    assert rows[0]["vendor_site_code"] is None
+
+def test_flatten_invoice_without_lines_yields_one_row():
+    invoice = dict(INVOICE, invoice_lines=[])
+    (row,) = flatten_invoice(invoice)
+    assert row["invoice_id"] == INVOICE["_id"]
+    assert row["line_number"] is None and row["description"] is None
+
+def test_csv_export_writes_header_and_rows(tmp_path):
+    output = tmp_path / "invoices.csv"
+    db = FakeDb([INVOICE])
+    result = export_invoices(db, str(output), fmt="csv")
+    assert result["invoices"] == 1 and result["rows"] == 2
+    # Exports only read; the index is created by ensure_export_indexes
+    assert db.invoices.indexes == []
+
+    with open(output, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        assert reader.fieldnames == [name for name, _ in COLUMNS]
+        rows = list(reader)
+    assert [row["description"] for row in rows] == ["Paper", "Toner"]
+    assert rows[1]["unit_price"] == ""
+
+def test_incremental_export_stops_at_safety_lag_and_stores_cutoff(tmp_path):
+    db = FakeDb([INVOICE])
+    since = datetime(2024, 3, 1)
+    before = datetime.utcnow()
+    result = export_invoices(db, str(tmp_path / "out.csv"), fmt="csv", since=since,
+                             incremental="finance", safety_lag=timedelta(minutes=5))
+
+    (query,) = db.invoices.queries
+    cutoff = query["processed_at"]["$lte"]
+    assert query["processed_at"]["$gt"] == since
+    assert before - timedelta(minutes=5) <= cutoff <= datetime.utcnow() - timedelta(minutes=5)
+    # The cut-off, not the newest exported processed_at, becomes the watermark
+    assert result["watermark"] == cutoff
+    assert db[EXPORT_STATE_COLLECTION].updates[0]["watermark"] == cutoff
+
+def test_ensure_export_indexes_creates_the_scan_index():
+    db = FakeDb([])
+    ensure_export_indexes(db)
+    assert db.invoices.indexes == [EXPORT_INDEX]
+
+def many_invoices(count):
+    return [
+        dict(INVOICE, _id=f"id-{i}", processed_at=datetime(2024, 3, 2, 9, 30 + i))
+        for i in range(count)
+    ]
+
+def expected_schema(pa):
+    types = {str: pa.string(), int: pa.int64(), float: pa.float64(), datetime: pa.timestamp("ms")}
+    return pa.schema([(name, types[column_type]) for name, column_type in COLUMNS])
+
+def test_parquet_export_writes_one_row_group_per_chunk(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    output = str(tmp_path / "invoices.parquet")
+    result = export_invoices(FakeDb(many_invoices(3)), output, fmt="parquet", chunk_rows=2)
+    assert result["rows"] == 6
+
+    parquet = pq.ParquetFile(output)
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.schema_arrow.equals(expected_schema(pa))
+    table = parquet.read()
+    assert table.column("invoice_id").to_pylist() == ["id-0", "id-0", "id-1", "id-1", "id-2", "id-2"]
+    assert table.column("line_amount").to_pylist() == [250.0, 1000.5] * 3
+    assert table.column("processed_at").to_pylist()[-1] == datetime(2024, 3, 2, 9, 32)
+
+def test_arrow_export_writes_one_record_batch_per_chunk(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    output = str(tmp_path / "invoices.arrow")
+    export_invoices(FakeDb(many_invoices(3)), output, fmt="arrow", chunk_rows=2)
+
+    with pa.OSFile(output, "rb") as source:
+        reader = pa.ipc.open_file(source)
+        assert reader.num_record_batches == 3
+        assert reader.schema.equals(expected_schema(pa))
+        table = reader.read_all()
+    assert table.num_rows == 6
+    assert table.column("unit_price").to_pylist() == [25.0, None] * 3
@@ -0,0 +1,171 @@
+import base64
+import copy
+import json
+import types
+from collections import defaultdict
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("google.generativeai")
+pytest.importorskip("forex_python")
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+import cassette
+import watch_and_save
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+MESSAGES = {
+    # PDF invoice read by Gemini, in EUR (forex), with line items missing prices (random)
+    "m1": {"payload": {"headers": [{"name": "Subject", "value": "Invoice A-77"}], "parts": [
+        {"mimeType": "text/plain", "filename": "", "body": {"data": _b64("Invoice A-77 attached")}},
+        {"mimeType": "application/pdf", "filename": "A-77.pdf", "body": {"attachmentId": "att1"}}
+    ]}},
+    # Plain email without an invoice number (generated from the clock), in INR
+    "m2": {"payload": {"headers": [{"name": "Subject", "value": "Your invoice"}], "parts": [
+        {"mimeType": "text/plain", "filename": "", "body": {"data": _b64("Please pay 5,000")}}
+    ]}},
+    # Attachment download fails
+    "m3": {"payload": {"headers": [{"name": "Subject", "value": "Invoice B-1"}], "parts": [
+        {"mimeType": "application/pdf", "filename": "B-1.pdf", "body": {"attachmentId": "gone"}}
+    ]}}
+}
+
+GEMINI_RESPONSE = json.dumps({
+    "invoice_num": "A-77",
+    "invoice_date": "2024-03-01",
+    "vendor_name": "Acme",
+    "invoice_amount": 1250.0,
+    "currency_code": "EUR",
+    "line_items": [{"description": "Consulting", "quantity": 2}]
+})
+
+class FakeRequest:
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        return self.response
+
+class FakeGmail:
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def attachments(self):
+        return self
+
+    def list(self, **kwargs):
+        return FakeRequest({"messages": [{"id": msg_id} for msg_id in MESSAGES]})
+
+    def get(self, **kwargs):
+        if "messageId" not in kwargs:
+            return FakeRequest(copy.deepcopy(MESSAGES[kwargs["id"]]))
+        if kwargs["id"] == "gone":
+            return FakeRequest(error=HttpError(httplib2.Response({"status": 404}), b'{"error": "gone"}'))
+        return FakeRequest({"data": _b64("%PDF-1.4 invoice A-77")})
+
+class FakeModel:
+    def generate_content(self, contents):
+        return types.SimpleNamespace(text=GEMINI_RESPONSE)
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find_one(self, query, projection=None):
+        (field, value), = query.items()
+        for doc in self.docs:
+            found = doc
+            for part in field.split("."):
+                found = (found or {}).get(part)
+            if found == value:
+                return doc
+        return None
+
+    def aggregate(self, pipeline):
+        return iter([])
+
+    def insert_one(self, doc):
+        doc["_id"] = len(self.docs) + 1
+        self.docs.append(copy.deepcopy(doc))
+        return types.SimpleNamespace(inserted_id=doc["_id"])
+
+    def bulk_write(self, operations, ordered=True):
+        pass
+
+    def replace_one(self, query, doc, upsert=False):
+        pass
+
+class FakeDb:
+    name = "invoice_automation"
+
+    def __init__(self):
+        self.collections = defaultdict(FakeCollection)
+        self.client = types.SimpleNamespace(drop_database=lambda name: None)
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+    @property
+    def invoices(self):
+        return self["invoices"]
+
+class NoValidation:
+    def __init__(self, validator):
+        pass
+
+    def drain_pending(self):
+        return []
+
+class FutureClock(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime(2099, 12, 31, 23, 59, 59)
+
+def _unavailable(*args, **kwargs):
+    raise AssertionError("replay must not reach external services")
+
+def run(monkeypatch, path, mode, **services):
+    db = FakeDb()
+    monkeypatch.setattr(watch_and_save, "connect_to_mongodb", lambda mongo_uri: db)
+    monkeypatch.setattr(watch_and_save, "ValidationService", NoValidation)
+    for name, replacement in services.items():
+        monkeypatch.setattr(watch_and_save, name, replacement)
+    watch_and_save.run_pipeline(path, mode, "mongodb://unused")
+    return [{key: value for key, value in doc.items() if key != "_id"} for doc in db.invoices.docs]
+
+def test_replay_inserts_the_recorded_documents(monkeypatch, tmp_path):
+    path = str(tmp_path / "cassette")
+    recorded = run(
+        monkeypatch, path, "record",
+        authenticate_gmail=FakeGmail,
+        initialize_gemini=FakeModel,
+        convert_currency_with_api=lambda amount, from_code, to_code: amount * 1.1
+    )
+    assert [doc["invoice_header"]["currency_code"] for doc in recorded] == ["EUR", "INR"]
+    assert recorded[0]["invoice_header"]["to_usd"] == 1375.0
+
+    # A different clock and unreachable services: everything must come from the cassette
+    monkeypatch.setattr(cassette, "datetime", FutureClock)
+    monkeypatch.setattr(watch_and_save, "datetime", FutureClock)
+    replayed = run(
+        monkeypatch, path, "replay",
+        authenticate_gmail=_unavailable,
+        initialize_gemini=_unavailable,
+        convert_currency_with_api=_unavailable
+    )
+    assert replayed == recorded
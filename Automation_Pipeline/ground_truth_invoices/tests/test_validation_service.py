@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+import types
+import uuid
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from invoice_validator import InvoiceValidator
+from validation_service import ValidationService
+
+# Local single-node replica set, e.g. `mongod --replSet rs0` followed by `rs.initiate()`
+TEST_MONGO_URI = os.environ.get(
+    "MONGO_TEST_URI", "mongodb://localhost:27017/?replicaSet=rs0&directConnection=true"
+)
+
+@pytest.fixture
+def db():
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        if not client.admin.command("hello").get("setName"):
+            pytest.skip("MongoDB at MONGO_TEST_URI is not a replica set")
+    except PyMongoError:
+        pytest.skip("No MongoDB replica set reachable at MONGO_TEST_URI")
+    name = f"invoice_automation_test_{uuid.uuid4().hex[:8]}"
+    yield client[name]
+    client.drop_database(name)
+    client.close()
+
+def make_invoice(invoice_num):
+    return {
+        "invoice_header": {
+            "invoice_num": invoice_num,
+            "invoice_date": "2024-03-01",
+            "vendor_name": "ABC Corp",
+            "invoice_amount": 100.0,
+            "currency_code": "USD",
+            "to_usd": 100.0,
+            "invoice_status": "pending"
+        },
+        "invoice_lines": [
+            {"description": "IT Services", "quantity": 1, "unit_price": 100.0, "line_amount": 100.0}
+        ]
+    }
+
+def start_service(db, max_batches=None):
+    service = ValidationService(InvoiceValidator(db=db), batch_size=10, max_wait_ms=200)
+    thread = threading.Thread(target=service.run, kwargs={"max_batches": max_batches}, daemon=True)
+    thread.start()
+    return service, thread
+
+def run_service(db, max_batches=1, insert_after_start=()):
+    """Run the service in a thread until max_batches, inserting documents once it is watching."""
+    service, thread = start_service(db, max_batches)
+    if insert_after_start:
+        assert service.ready.wait(timeout=30), "validation service did not open its change stream"
+        db.invoices.insert_many([make_invoice(num) for num in insert_after_start])
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "validation service did not finish its micro-batch"
+    return service
+
+def statuses(db):
+    return {
+        doc["invoice_header"]["invoice_num"]: doc["invoice_header"]["invoice_status"]
+        for doc in db.invoices.find({}, {"invoice_header.invoice_num": 1, "invoice_header.invoice_status": 1})
+    }
+
+def test_scores_backlog_and_new_inserts_then_resumes(db):
+    db.invoices.insert_one(make_invoice("BACKLOG-1"))
+
+    service = run_service(db, insert_after_start=["NEW-1", "NEW-2"])
+    assert all(status != "pending" for status in statuses(db).values())
+    assert db.invoices.count_documents({"validation_details": {"$exists": True}}) == 3
+    token = service.load_resume_token()
+    assert token is not None
+
+    # Inserted while the service is stopped: picked up after a restart
+    db.invoices.insert_one(make_invoice("WHILE-STOPPED"))
+    restarted = run_service(db)
+    assert statuses(db)["WHILE-STOPPED"] != "pending"
+    assert restarted.load_resume_token() != token
+
+def test_keeps_running_when_the_collection_is_dropped(db):
+    service, thread = start_service(db)
+    try:
+        assert service.ready.wait(timeout=30), "validation service did not open its change stream"
+        # What an ingest run does before loading new invoices
+        db.invoices.drop()
+        db.invoices.insert_one(make_invoice("AFTER-DROP"))
+
+        deadline = time.monotonic() + 30
+        while statuses(db).get("AFTER-DROP") == "pending" and time.monotonic() < deadline:
+            assert thread.is_alive(), "validation service stopped after the drop"
+            time.sleep(0.1)
+        assert statuses(db)["AFTER-DROP"] != "pending"
+    finally:
+        service.stop()
+        thread.join(timeout=30)
+    assert not thread.is_alive()
+
+class FakeStream:
+    def __init__(self, changes):
+        self.changes = list(changes)
+
+    def try_next(self):
+        return self.changes.pop(0) if self.changes else None
+
+def test_next_batch_stops_at_an_invalidate_event():
+    service = ValidationService(types.SimpleNamespace(db=None), batch_size=10, max_wait_ms=200)
+    stream = FakeStream([
+        {"operationType": "insert", "documentKey": {"_id": 1}},
+        {"operationType": "invalidate"},
+        {"operationType": "insert", "documentKey": {"_id": 2}}
+    ])
+    assert service._next_batch(stream) == ([1], True)
+    assert service._next_batch(FakeStream([{"operationType": "insert", "documentKey": {"_id": 3}}])) == ([3], False)
@@ -0,0 +1,191 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+from invoice_validator import InvoiceValidator
+
+# Collection storing the change stream resume token between restarts
+STATE_COLLECTION = "validator_state"
+STATE_ID = "invoice_change_stream"
+
+# Only pending inserts matter, and only their ids are needed from the event.
+# Invalidate events (the collection or database was dropped) end the stream.
+CHANGE_STREAM_PIPELINE = [
+    {"$match": {"$or": [
+        {"operationType": "insert", "fullDocument.invoice_header.invoice_status": "pending"},
+        {"operationType": "invalidate"}
+    ]}},
+    {"$project": {"_id": 1, "operationType": 1, "documentKey": 1}}
+]
+
+# MongoDB error codes for a stored token the stream cannot be reopened from
+# (InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost)
+CHANGE_STREAM_TOKEN_ERRORS = {260, 280, 286}
+
+# Attempts per invoice within one run; later failures are retried on the next start
+MAX_ATTEMPTS = 3
+
+class ValidationService:
+    """
+    Validate invoices as they are inserted, using a change stream on `invoices`.
+
+    Change streams need a replica set. For local testing a single node is enough:
+
+        mongod --replSet rs0 --dbpath /tmp/rs0
+        mongosh --eval "rs.initiate()"
+        MONGO_URI="mongodb://localhost:27017/?replicaSet=rs0" python cli.py serve
+    """
+
+    def __init__(self, validator: InvoiceValidator, batch_size: int = 50, max_wait_ms: int = 1000):
+        """
+        Args:
+            validator: Validator used to score invoices (its db is watched)
+            batch_size: Maximum invoices scored per micro-batch
+            max_wait_ms: Longest time a micro-batch waits to fill before it is scored
+        """
+        self.validator = validator
+        self.db = validator.db
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        # Invoice id -> failed attempts, retried with the following micro-batches
+        self.retry_ids = {}
+        # Set once the stream is open and the pending backlog has been scored
+        self.ready = threading.Event()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Ask run() to return after the current micro-batch"""
+        self._stopped.set()
+
+    def load_resume_token(self) -> Optional[Dict]:
+        """Return the stored resume token, if any"""
+        state = self.db[STATE_COLLECTION].find_one({"_id": STATE_ID})
+        return state.get("resume_token") if state else None
+
+    def save_resume_token(self, token: Optional[Dict]):
+        """Persist the resume token (None clears it)"""
+        self.db[STATE_COLLECTION].update_one(
+            {"_id": STATE_ID},
+            {"$set": {"resume_token": token, "updated_at": time.time()}},
+            upsert=True
+        )
+
+    def process_batch(self, invoice_ids: List[Any]) -> List[Dict]:
+        """
+        Score a micro-batch, skipping invoices that are no longer pending.
+
+        Failed invoices stay pending and are queued in retry_ids for the next
+        micro-batch, up to MAX_ATTEMPTS per run.
+        """
+        pending = self.db.invoices.find(
+            {"_id": {"$in": invoice_ids}, "invoice_header.invoice_status": "pending"},
+            {"_id": 1}
+        )
+        results = []
+        for invoice in pending:
+            invoice_id = invoice["_id"]
+            try:
+                results.append(self.validator.process_new_invoice(invoice_id))
+                self.retry_ids.pop(invoice_id, None)
+            except Exception as e:
+                print(f"Error processing invoice {invoice_id}: {str(e)}")
+                results.append({"invoice_id": str(invoice_id), "error": str(e)})
+                attempts = self.retry_ids.get(invoice_id, 0) + 1
+                if attempts < MAX_ATTEMPTS:
+                    self.retry_ids[invoice_id] = attempts
+                else:
+                    print(f"Giving up on invoice {invoice_id} until the next start.")
+                    self.retry_ids.pop(invoice_id, None)
+        return results
+
+    def drain_pending(self) -> List[Dict]:
+        """Score every invoice that is currently pending, in micro-batches"""
+        cursor = self.db.invoices.find(
+            {"invoice_header.invoice_status": "pending"},
+            {"_id": 1},
+            batch_size=self.batch_size
+        )
+        results = []
+        batch = []
+        for invoice in cursor:
+            batch.append(invoice["_id"])
+            if len(batch) >= self.batch_size:
+                results.extend(self.process_batch(batch))
+                batch = []
+        if batch:
+            results.extend(self.process_batch(batch))
+        return results
+
+    def _next_batch(self, stream) -> Tuple[List[Any], bool]:
+        """
+        Collect up to batch_size inserted ids, waiting at most max_wait_ms.
+
+        Returns the ids and whether the stream was invalidated.
+        """
+        batch = []
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.batch_size and time.monotonic() < deadline:
+            change = stream.try_next()
+            if change is None:
+                if batch:
+                    break
+            elif change["operationType"] == "invalidate":
+                return batch, True
+            else:
+                batch.append(change["documentKey"]["_id"])
+        return batch, False
+
+    def run(self, max_batches: Optional[int] = None):
+        """
+        Watch for pending inserts and score them until interrupted.
+
+        On every start the stream is opened (starting after the stored token)
+        and then every invoice still pending is scored, which also picks up
+        invoices that failed during an earlier run. The token is saved after
+        each micro-batch. When the collection is dropped (e.g. by an ingest
+        run) the stream is reopened the same way. max_batches stops after
+        that many non-empty micro-batches (useful in tests); so does stop().
+        """
+        processed_batches = 0
+        while not self._stopped.is_set():
+            token = self.load_resume_token()
+            try:
+                # start_after (unlike resume_after) also accepts an invalidate event's token
+                with self.db.invoices.watch(
+                    CHANGE_STREAM_PIPELINE,
+                    start_after=token,
+                    max_await_time_ms=self.max_wait_ms
+                ) as stream:
+                    # The stream is open before the backlog is read, so nothing falls in between
+                    backlog = self.drain_pending()
+                    print(f"Validated {len(backlog)} pending invoices.")
+                    if token is None:
+                        self.save_resume_token(stream.resume_token)
+                        token = stream.resume_token
+                    self.ready.set()
+
+                    invalidated = False
+                    while stream.alive and not invalidated and not self._stopped.is_set():
+                        new_ids, invalidated = self._next_batch(stream)
+                        batch = list(self.retry_ids) + new_ids
+                        if batch:
+                            results = self.process_batch(batch)
+                            print(f"Validated micro-batch of {len(results)} invoices.")
+                            processed_batches += 1
+                        if stream.resume_token != token:
+                            token = stream.resume_token
+                            self.save_resume_token(token)
+                        if max_batches is not None and processed_batches >= max_batches:
+                            return
+                    if invalidated:
+                        print("Invoices collection was dropped; reopening the change stream.")
+            except OperationFailure as e:
+                if e.code not in CHANGE_STREAM_TOKEN_ERRORS:
+                    raise
+                # The stored token cannot be used any more: rescan pending invoices instead
+                print(f"Cannot resume the change stream ({e.code}); rescanning pending invoices.")
+                self.save_resume_token(None)
+            finally:
+                self.ready.clear()
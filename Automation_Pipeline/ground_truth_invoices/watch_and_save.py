@@ -5,7 +5,6 @@ from googleapiclient.errors import HttpError
 import base64
 import pickle
 import os
-import pymongo
 from datetime import datetime, timedelta
 import re
 import json
@@ -17,6 +16,12 @@ import time
 from functools import wraps
 
 from invoice_validator import InvoiceValidator
+from validation_service import ValidationService
+from mongo_pool import get_database, close_mongo_clients
+from analytics_rollups import record_invoice
+from duplicate_index import find_near_duplicates, add_to_index, ensure_indexes
+from invoice_export import ensure_export_indexes
+from cassette import Cassette, CassetteService, CassetteModel
 
 # Define scopes - we need read access to Gmail
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
@@ -25,7 +30,7 @@ SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 GEMINI_API_KEY = "YOUR API KEY HERE"
 
 # MongoDB connection string
-MONGO_URI = "YOUR MONGO DB PUBLIC URL HERE"
+MONGO_URI = os.environ.get("MONGO_URI", "YOUR MONGO DB PUBLIC URL HERE")
 
 # Sample data
 currencies = ["INR", "USD", "EUR", "GBP"]
@@ -72,8 +77,8 @@ def convert_currency_with_api(amount, from_currency, to_currency="USD"):
     c = CurrencyRates()
     return c.convert(from_currency, to_currency, amount)
 
-def convert_invoice_to_usd_and_status(invoice_doc):
-    """Convert invoice amount to USD with fallback mechanism"""
+def convert_invoice_to_usd_and_status(invoice_doc, cassette=None):
+    """Convert invoice amount to USD with fallback mechanism (recorded/replayed via cassette)"""
     hdr = invoice_doc.get("invoice_header", {})
     amount = hdr.get("invoice_amount")
     code = hdr.get("currency_code", "USD").upper()
@@ -89,9 +94,15 @@ def convert_invoice_to_usd_and_status(invoice_doc):
         if code != "USD":
             try:
                 # First try with live API
-                usd_amount = convert_currency_with_api(amount, code, "USD")
+                if cassette is not None:
+                    usd_amount = cassette.call(
+                        "forex.convert", [amount, code, "USD"],
+                        lambda: convert_currency_with_api(amount, code, "USD")
+                    )
+                else:
+                    usd_amount = convert_currency_with_api(amount, code, "USD")
                 hdr["to_usd"] = round(usd_amount, 2)
-            except:
+            except Exception:
                 # Fallback to hardcoded rates if API fails
                 if code in FALLBACK_RATES:
                     hdr["to_usd"] = round(amount * FALLBACK_RATES[code], 2)
@@ -140,12 +151,12 @@ def authenticate_gmail():
     
     return build('gmail', 'v1', credentials=creds)
 
-def connect_to_mongodb():
-    """Connects to the specified MongoDB database."""
+def connect_to_mongodb(mongo_uri=MONGO_URI):
+    """Connects to the specified MongoDB database through the shared pool."""
     try:
-        client = pymongo.MongoClient(MONGO_URI)
-        client.server_info()
-        return client["invoice_automation"]
+        db = get_database(mongo_uri)
+        db.client.server_info()
+        return db
     except Exception as e:
         print(f"Failed to connect to MongoDB: {e}")
         raise
@@ -170,9 +181,10 @@ def initialize_gemini():
     genai.configure(api_key=GEMINI_API_KEY)
     return genai.GenerativeModel('gemini-1.5-flash')
 
-def process_pdf_with_gemini(pdf_content):
+def process_pdf_with_gemini(pdf_content, model=None):
     """Process a PDF with Gemini API to extract invoice information."""
-    model = initialize_gemini()
+    if model is None:
+        model = initialize_gemini()
     
     prompt = """
     Analyze this invoice PDF and extract the following information in JSON format:
@@ -216,15 +228,16 @@ def process_pdf_with_gemini(pdf_content):
         print(f"Error processing with Gemini API: {e}")
         return {}
 
-def create_invoice_document(gemini_data, pdf_base64=None):
-    """Create invoice document with clean data."""
-    invoice_num = gemini_data.get("invoice_num") or f"INV{datetime.now().strftime('%Y%m%d%H%M%S')}"
+def create_invoice_document(gemini_data, pdf_base64=None, now=None):
+    """Create invoice document with clean data (now: clock used for generated values)."""
+    now = now or datetime.now()
+    invoice_num = gemini_data.get("invoice_num") or f"INV{now.strftime('%Y%m%d%H%M%S')}"
     
     invoice_doc = {
         "invoice_header": {
             "organization_code": 100000,
             "invoice_num": invoice_num,
-            "invoice_date": gemini_data.get("invoice_date", datetime.now().strftime("%Y-%m-%d")),
+            "invoice_date": gemini_data.get("invoice_date", now.strftime("%Y-%m-%d")),
             "vendor_name": gemini_data.get("vendor_name", random.choice(vendors)),
             "vendor_site_code": f"V{str(random.randint(1, 100)).zfill(3)}",
             "invoice_amount": float(gemini_data.get("invoice_amount", 0)) if gemini_data.get("invoice_amount") else None,
@@ -269,15 +282,16 @@ def create_invoice_document(gemini_data, pdf_base64=None):
     
     return invoice_doc
 
-def extract_basic_invoice_details(message_payload):
-    """Extracts basic invoice details from email content."""
-    invoice_num = f"INV{datetime.now().strftime('%Y%m%d%H%M%S')}"
+def extract_basic_invoice_details(message_payload, now=None):
+    """Extracts basic invoice details from email content (now: clock used for generated values)."""
+    now = now or datetime.now()
+    invoice_num = f"INV{now.strftime('%Y%m%d%H%M%S')}"
     
     invoice_doc = {
         "invoice_header": {
             "organization_code": 100000,
             "invoice_num": invoice_num,
-            "invoice_date": datetime.now().strftime("%Y-%m-%d"),
+            "invoice_date": now.strftime("%Y-%m-%d"),
             "vendor_name": random.choice(vendors),
             "vendor_site_code": f"V{str(random.randint(1, 100)).zfill(3)}",
             "invoice_amount": None,
@@ -346,7 +360,7 @@ def extract_basic_invoice_details(message_payload):
     
     return invoice_doc
 
-def process_email(service, msg_id, db):
+def process_email(service, msg_id, db, model=None, cassette=None):
     """Processes a single email with invoice in subject."""
     try:
         message = service.users().messages().get(userId='me', id=msg_id, format='full').execute()
@@ -373,31 +387,46 @@ def process_email(service, msg_id, db):
         
         invoices_collection = db['invoices']
         
+        # Generated invoice numbers and dates come from the recorded clock when replaying
+        now = cassette.now() if cassette is not None else datetime.now()
+        
         if pdf_content:
             try:
-                gemini_data = process_pdf_with_gemini(pdf_content)
+                gemini_data = process_pdf_with_gemini(pdf_content, model)
                 if gemini_data:
-                    invoice_doc = create_invoice_document(gemini_data, pdf_base64)
+                    invoice_doc = create_invoice_document(gemini_data, pdf_base64, now)
                 else:
-                    invoice_doc = extract_basic_invoice_details(message['payload'])
+                    invoice_doc = extract_basic_invoice_details(message['payload'], now)
                     invoice_doc["invoice_header"]["pdf_base64"] = pdf_base64
             except Exception as e:
                 print(f"Error processing with Gemini API: {e}")
-                invoice_doc = extract_basic_invoice_details(message['payload'])
+                invoice_doc = extract_basic_invoice_details(message['payload'], now)
                 invoice_doc["invoice_header"]["pdf_base64"] = pdf_base64
         else:
-            invoice_doc = extract_basic_invoice_details(message['payload'])
+            invoice_doc = extract_basic_invoice_details(message['payload'], now)
         
-        invoice_doc = convert_invoice_to_usd_and_status(invoice_doc)
+        invoice_doc = convert_invoice_to_usd_and_status(invoice_doc, cassette)
         
         # Check for existing invoice
-        existing_invoice = invoices_collection.find_one({"invoice_header.invoice_num": invoice_doc["invoice_header"]["invoice_num"]})
+        existing_invoice = invoices_collection.find_one(
+            {"invoice_header.invoice_num": invoice_doc["invoice_header"]["invoice_num"]},
+            {"_id": 1}
+        )
         if existing_invoice:
             print(f"Invoice {invoice_doc['invoice_header']['invoice_num']} already exists. Skipping.")
             return None
         
+        # Flag likely duplicates (misread or generated invoice numbers) for review
+        duplicates = find_near_duplicates(db, invoice_doc)
+        if duplicates:
+            invoice_doc["duplicate_candidates"] = duplicates
+            print(f"Invoice {invoice_doc['invoice_header']['invoice_num']} looks like a duplicate of "
+                  f"{', '.join(str(d['invoice_num']) for d in duplicates)}")
+        
         # Insert into MongoDB
         result = invoices_collection.insert_one(invoice_doc)
+        record_invoice(db, invoice_doc)
+        add_to_index(db, invoice_doc)
         
         print(f"Successfully processed invoice: {invoice_doc['invoice_header']['invoice_num']}")
         return result.inserted_id
@@ -409,22 +438,55 @@ def process_email(service, msg_id, db):
         print(f"Error processing email: {e}")
         return None
 
-def main():
-    """Main function to authenticate and process invoice emails."""
-    print("Authenticating with Gmail API...")
-    service = authenticate_gmail()
-    print("Gmail API connected successfully!")
+def main(cassette_path=None, cassette_mode=None, mongo_uri=MONGO_URI):
+    """Run the pipeline, then close the shared MongoDB connections."""
+    try:
+        run_pipeline(cassette_path, cassette_mode, mongo_uri)
+    finally:
+        close_mongo_clients()
+
+def run_pipeline(cassette_path=None, cassette_mode=None, mongo_uri=MONGO_URI):
+    """
+    Authenticate and process invoice emails.
+    
+    With cassette_mode "record", every Gmail, Gemini and currency response is
+    saved to cassette_path; with "replay", the run is fed from that store
+    without touching the network.
+    """
+    cassette = Cassette(cassette_path, cassette_mode) if cassette_mode else None
+    model = None
+    
+    if cassette is not None and cassette.replaying:
+        print(f"Replaying Gmail and Gemini responses from {cassette_path}")
+        service = CassetteService(cassette)
+        model = CassetteModel(cassette)
+    else:
+        print("Authenticating with Gmail API...")
+        service = authenticate_gmail()
+        print("Gmail API connected successfully!")
+        if cassette is not None:
+            print(f"Recording Gmail and Gemini responses to {cassette_path}")
+            service = CassetteService(cassette, service)
+            model = CassetteModel(cassette, initialize_gemini())
     
     print("Connecting to MongoDB...")
     try:
-        db = connect_to_mongodb()
-        db.client.drop_database("invoice_automation")
-        print("Dropped invoice_automation database.")
+        db = connect_to_mongodb(mongo_uri)
+        db.client.drop_database(db.name)
+        print(f"Dropped {db.name} database.")
+        ensure_indexes(db)
+        ensure_export_indexes(db)
     except Exception as e:
         print(f"Failed to connect to MongoDB: {e}")
         return
     
     start_date = datetime.now() - timedelta(days=30)
+    if cassette is not None:
+        # Replays reuse the recorded query window and random seed so they are deterministic
+        if not cassette.replaying:
+            cassette.set_meta(start_date=start_date.isoformat(), seed=random.randrange(1 << 32))
+        start_date = datetime.fromisoformat(cassette.meta["start_date"])
+        random.seed(cassette.meta["seed"])
     print(f"Retrieving emails with 'invoice' in subject since {start_date.strftime('%Y-%m-%d')}...")
     
     # Only get emails with "invoice" in the subject
@@ -437,13 +499,14 @@ def main():
     print(f"Found {len(invoice_emails)} potential invoice emails.")
     
     for email in invoice_emails:
-        process_email(service, email['id'], db)
+        process_email(service, email['id'], db, model, cassette)
     
     print("Email processing complete.")
 
     print("\nStarting invoice validation...")
-    validator = InvoiceValidator(mongo_uri=MONGO_URI)
-    validator.process_pending_invoices()
+    validator = InvoiceValidator(mongo_uri=mongo_uri, db=db)
+    results = ValidationService(validator).drain_pending()
+    print(f"Validated {len(results)} invoices.")
     print("Invoice validation complete.")
 
 if __name__ == '__main__':